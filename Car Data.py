@@ -1,17 +1,30 @@
+import functools
+
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+import numpy as np
 import plotly.express as px
 import pandas as pd
 
+from figure_patch import FigureDiffer
+
 # Load the data
 data_path = "./csv_files/Car Data.csv"
 data = pd.read_csv(data_path)
 
+# Histograms use numpy's "auto" bin count, capped at this many bins
+MAX_BINS = 100
+# Categorical bar charts show this many values, the rest are summed as "Other"
+TOP_N = 50
+
 # Initialize the Dash app
 app = dash.Dash(__name__)
 
+# Figures sent to the browser, so the next one can go out as a Patch
+figure_differ = FigureDiffer()
+
 # Define the layout of the web application
 app.layout = html.Div(
     [
@@ -23,30 +36,85 @@ app.layout = html.Div(
             multi=False,
         ),
         dcc.Graph(id="bar-plot"),
+        # Version id of the figure currently shown in bar-plot
+        dcc.Store(id="bar-plot-version"),
     ]
 )
 
 
+def integer_bin_edges(values, width):
+    # Bins spanning a whole number of steps between the column's values (1 for
+    # years, 5000 for mileages rounded to 5000), with edges halfway between two
+    # steps, so every bin covers the same number of possible values and no bin
+    # is left empty in between
+    unique = np.unique(values)
+    step = (
+        int(np.gcd.reduce(np.diff(unique).astype(np.int64))) if len(unique) > 1 else 1
+    )
+    width = step * max(1, int(np.ceil(width / step)))
+    n_bins = int((unique[-1] - unique[0]) // width) + 1
+    return unique[0] - step / 2 + width * np.arange(n_bins + 1)
+
+
+@functools.lru_cache(maxsize=None)
+def column_summary(column):
+    # Computed once per column on first use. The charts are built from these
+    # small tables, so the figure size depends on the bin / value count and not
+    # on the number of rows.
+    series = data[column]
+    if pd.api.types.is_numeric_dtype(series):
+        values = series.dropna().to_numpy(dtype=np.float64)
+        edges = np.histogram_bin_edges(values, bins="auto")
+        if len(edges) - 1 > MAX_BINS:
+            edges = np.histogram_bin_edges(values, bins=MAX_BINS)
+        if pd.api.types.is_integer_dtype(series) and len(values):
+            edges = integer_bin_edges(values, edges[1] - edges[0])
+        counts, edges = np.histogram(values, bins=edges)
+        return pd.DataFrame(
+            {
+                column: (edges[:-1] + edges[1:]) / 2,
+                "count": counts,
+                "width": np.diff(edges),
+            }
+        )
+    counts = series.value_counts()
+    if len(counts) > TOP_N:
+        other = pd.Series({"Other": counts.iloc[TOP_N:].sum()})
+        counts = pd.concat([counts.iloc[:TOP_N], other])
+    counts = counts.reset_index()
+    counts.columns = [column, "count"]  # Explicitly name columns
+    return counts
+
+
 # Define callback to update graph
-@app.callback(Output("bar-plot", "figure"), [Input("column-dropdown", "value")])
-def update_graph(selected_column):
+@app.callback(
+    [Output("bar-plot", "figure"), Output("bar-plot-version", "data")],
+    [Input("column-dropdown", "value")],
+    [State("bar-plot-version", "data")],
+)
+def update_graph(selected_column, version):
+    summary = column_summary(selected_column)
     if pd.api.types.is_numeric_dtype(data[selected_column]):
-        # If the data type is numeric, show a histogram
-        fig = px.histogram(
-            data, x=selected_column, title=f"Histogram of {selected_column}"
+        # If the data type is numeric, show a histogram of the pre-binned counts
+        fig = px.bar(
+            summary,
+            x=selected_column,
+            y="count",
+            title=f"Histogram of {selected_column}",
         )
+        fig.update_traces(width=summary["width"])
+        fig.update_layout(bargap=0)
     else:
         # If the data type is categorical, show a bar chart of value counts
-        counts = data[selected_column].value_counts().reset_index()
-        counts.columns = [selected_column, "count"]  # Explicitly name columns
         fig = px.bar(
-            counts,
+            summary,
             x=selected_column,
             y="count",
             title=f"Bar Chart of {selected_column}",
         )
         fig.update_layout(xaxis_title=selected_column, yaxis_title="Count")
-    return fig
+    # Only the parts that differ from the figure on screen are sent
+    return figure_differ.update(fig, version)
 
 
 # Run the application
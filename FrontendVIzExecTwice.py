@@ -1,216 +1,337 @@
 import base64
-import io
 import traceback
+import uuid
 
 import dash
 import dash_bootstrap_components as dbc  # Import Dash Bootstrap components
 from dash import dcc, html, dash_table, Input, Output, State
-import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from scipy.stats import linregress
+
+from dataset_cache import DatasetCache, content_hash
+from exec_cache import result_key, run_pipeline
+from ingest import read_csv
+from sandbox import Sandbox, SandboxError
+from session_store import SessionStore
 
 app = dash.Dash(
     __name__, external_stylesheets=[dbc.themes.BOOTSTRAP]
 )  # Import Bootstrap CSS
 
-app.layout = html.Div(
-    [
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.H5("Upload File"),
-                        dcc.Upload(
-                            id="upload-data",
-                            children=dbc.Button(
-                                "Upload File",
-                                id="upload-data-button",
-                                className="mr-2",
-                            ),
-                            style={
-                                "display": "inline-block",
-                            },  # Changed style to display button
-                        ),
-                        dbc.FormText("Choose a CSV file to upload.", className="mt-2"),
-                    ],
-                    width={
-                        "size": 6,
-                        "offset": 0,
-                    },  # size of the column and offset from the left
-                )
-            ],
-            style={"backgroundColor": "#f8f9fa"},  # Change background color
-            className="mb-3 pb-2 shadow",  # padding
-        ),
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.H5("Original Data"),
-                        html.Div(id="input-data"),
-                    ]
-                )
-            ],
-            style={"backgroundColor": "#f8f9fa"},  # Change background color
-            className="mb-3 pb-2 shadow",  # padding
-        ),
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.H5("Transformed Data"),
-                        dbc.InputGroup(
-                            [
-                                dbc.Textarea(
-                                    id="transform-code-input",
-                                    placeholder="Enter transformation code...",
-                                ),
-                                dbc.Button("Transform", id="transform-button"),
-                            ],
-                            className="mb-3",
-                        ),
-                        html.Div(id="transformed-data"),
-                    ]
-                ),
-            ],
-            style={"backgroundColor": "#f8f9fa"},  # Change background color
-            className="mb-3 pb-2 shadow",  # padding
-        ),
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.H5("Visualize Data"),
-                        dbc.InputGroup(
-                            [
-                                dbc.Textarea(
-                                    id="plotly-code-input",
-                                    placeholder="Enter Plotly code...",
+# Uploaded and transformed dataframes, one directory per browser session
+session_store = SessionStore()
+# Results of transformation and plotting code, keyed by input dataset and code
+result_cache = DatasetCache("./cache/results")
+# User code runs in separate worker processes with a timeout and memory cap
+sandbox = Sandbox()
+
+
+def serve_layout():
+    # Called for every page load, so each browser tab gets its own session id
+    return html.Div(
+        [
+            dcc.Store(id="session-id", data=str(uuid.uuid4())),
+            # Transformation code of each pipeline cell, applied in order
+            dcc.Store(id="pipeline-cells", data=[]),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.H5("Upload File"),
+                            dcc.Upload(
+                                id="upload-data",
+                                children=dbc.Button(
+                                    "Upload File",
+                                    id="upload-data-button",
+                                    className="mr-2",
                                 ),
-                                dbc.Button("Plot", id="plot-button"),
-                            ],
-                            className="mb-3",
-                        ),
-                        html.Div(id="plot-output-status"),
-                        dcc.Graph(id="plot-output"),
-                    ],
-                    className="mb-3",
-                )
-            ],
-            style={"backgroundColor": "#f8f9fa"},  # Change background color
-            className="mb-3 pb-2 shadow",  # padding
-        ),
-    ],
-    className="p-5",  # padding
-)
+                                style={
+                                    "display": "inline-block",
+                                },  # Changed style to display button
+                            ),
+                            dbc.FormText(
+                                "Choose a CSV file to upload.", className="mt-2"
+                            ),
+                        ],
+                        width={
+                            "size": 6,
+                            "offset": 0,
+                        },  # size of the column and offset from the left
+                    )
+                ],
+                style={"backgroundColor": "#f8f9fa"},  # Change background color
+                className="mb-3 pb-2 shadow",  # padding
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.H5("Original Data"),
+                            html.Div(id="input-data"),
+                        ]
+                    )
+                ],
+                style={"backgroundColor": "#f8f9fa"},  # Change background color
+                className="mb-3 pb-2 shadow",  # padding
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.H5("Transformed Data"),
+                            html.Div(id="pipeline-view"),
+                            dcc.Dropdown(
+                                id="cell-select",
+                                options=[{"label": "New cell", "value": -1}],
+                                value=-1,
+                                clearable=False,
+                                className="mb-2",
+                            ),
+                            dbc.InputGroup(
+                                [
+                                    dbc.Textarea(
+                                        id="transform-code-input",
+                                        placeholder="Enter transformation code...",
+                                    ),
+                                    dbc.Button("Transform", id="transform-button"),
+                                    dbc.Button(
+                                        "Cancel",
+                                        id="cancel-transform-button",
+                                        color="secondary",
+                                    ),
+                                ],
+                                className="mb-3",
+                            ),
+                            html.Div(id="transformed-data"),
+                        ]
+                    ),
+                ],
+                style={"backgroundColor": "#f8f9fa"},  # Change background color
+                className="mb-3 pb-2 shadow",  # padding
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.H5("Visualize Data"),
+                            dbc.InputGroup(
+                                [
+                                    dbc.Textarea(
+                                        id="plotly-code-input",
+                                        placeholder="Enter Plotly code...",
+                                    ),
+                                    dbc.Button("Plot", id="plot-button"),
+                                    dbc.Button(
+                                        "Cancel",
+                                        id="cancel-plot-button",
+                                        color="secondary",
+                                    ),
+                                ],
+                                className="mb-3",
+                            ),
+                            html.Div(id="cancel-status"),
+                            html.Div(id="plot-output-status"),
+                            dcc.Graph(id="plot-output"),
+                        ],
+                        className="mb-3",
+                    )
+                ],
+                style={"backgroundColor": "#f8f9fa"},  # Change background color
+                className="mb-3 pb-2 shadow",  # padding
+            ),
+        ],
+        className="p-5",  # padding
+    )
+
 
-global_df = None  # A global variable to hold the transformed dataframe
+app.layout = serve_layout
 
 
 def parse_contents(contents):
     content_type, content_string = contents.split(",")
     decoded = base64.b64decode(content_string)
-    return pd.read_csv(io.StringIO(decoded.decode("utf-8")))
+    return read_csv(decoded)
 
 
 @app.callback(
-    Output("input-data", "children"),
+    [Output("input-data", "children"), Output("pipeline-cells", "data")],
     [Input("upload-data", "contents")],
-    [State("upload-data", "filename")],
+    [State("upload-data", "filename"), State("session-id", "data")],
 )
-def update_input(contents, filename):
-    global global_df
+def update_input(contents, filename, session_id):
     if contents is None:
-        return
+        return None, []
     df = parse_contents(contents)
-    global_df = df.copy()
+    # "source" is the input of the first pipeline cell, "df" the output of the last
+    version = content_hash(contents)
+    session_store.put(session_id, "source", df, version=version)
+    session_store.put(session_id, "df", df, version=version)
     df = df.iloc[:5, :]
-    return html.Div(
-        [
-            html.H6(f"File: {filename}"),  # Display filename
-            html.Pre(df.head().to_string(index=False)),
-            html.H6(f"Ask about Original Data"),
-            dbc.InputGroup(
-                [
-                    dbc.Textarea(
-                        id="question-original-data",
-                        placeholder="Enter question about original data...",
-                    ),
-                    dbc.Button("Ask", id="question-original-data-button"),
-                ],
-                className="mb-3",
-            ),
-            dbc.Textarea(
-                id="answer-original-data",
-                placeholder="Answer...",
-            ),
-        ]
+    return (
+        html.Div(
+            [
+                html.H6(f"File: {filename}"),  # Display filename
+                html.Pre(df.head().to_string(index=False)),
+                html.H6(f"Ask about Original Data"),
+                dbc.InputGroup(
+                    [
+                        dbc.Textarea(
+                            id="question-original-data",
+                            placeholder="Enter question about original data...",
+                        ),
+                        dbc.Button("Ask", id="question-original-data-button"),
+                    ],
+                    className="mb-3",
+                ),
+                dbc.Textarea(
+                    id="answer-original-data",
+                    placeholder="Answer...",
+                ),
+            ]
+        ),
+        [],
     )
 
 
+def _error_message(e):
+    if isinstance(e, SandboxError):
+        return str(e)  # Already holds the traceback from the worker process
+    return f"{str(e)}\n\n{traceback.format_exc()}"
+
+
 @app.callback(
-    Output("transformed-data", "children"),
+    [
+        Output("transformed-data", "children"),
+        # update_input also writes the cells (it clears them on a new upload)
+        Output("pipeline-cells", "data", allow_duplicate=True),
+    ],
     [Input("transform-button", "n_clicks")],
     [
-        State("upload-data", "contents"),
+        State("upload-data", "filename"),
         State("transform-code-input", "value"),
+        State("cell-select", "value"),
+        State("pipeline-cells", "data"),
+        State("session-id", "data"),
     ],
+    prevent_initial_call=True,
 )
-def update_transform(n, contents, code):
-    global global_df
-    if n is None or contents is None or code is None:
-        return
-    local_vars = {"df": global_df}  # Create a dictionary to hold local variables
+def update_transform(n, filename, code, cell, cells, session_id):
+    # The upload is already in the session store, so only its version is read
+    # here instead of sending the file contents with every click
+    version = session_store.version(session_id, "source")
+    if n is None or filename is None or code is None:
+        return None, dash.no_update
+    if version is None:
+        # A file was uploaded but the store has since evicted the session. Nothing
+        # is run or cached, since the cells would get no df and their result keys
+        # would not be tied to this upload.
+        return (
+            html.Div(
+                [
+                    html.H5("Error"),
+                    html.Pre("Session expired, please upload the file again"),
+                ]
+            ),
+            dash.no_update,
+        )
+    # Adds a new cell, or replaces the selected one
+    cells = list(cells or [])
+    if cell is None or cell < 0 or cell >= len(cells):
+        cells.append(code)
+    else:
+        cells[cell] = code
     print(code)
+
+    def run_cell(cell_code, data):
+        return sandbox.run(cell_code, data, output="df", token=session_id)
+
+    # The first cell's worker memory-maps the session's Arrow file as df
+    source = session_store.path(session_id, "source")
     try:
-        exec(code, globals(), local_vars)  # Execute the transformation code
+        # Cells whose output is cached (everything before an edited cell) are not
+        # run again; their frames spill from memory to disk in result_cache
+        df, key = run_pipeline(cells, version, source, run_cell, result_cache)
+        # Update the session's dataframe and remember which result it holds
+        session_store.put(session_id, "df", df, version=key)
     except Exception as e:
-        error_message = f"{str(e)}\n\n{traceback.format_exc()}"
-        return html.Div(
-            [
-                html.H5("Error"),
-                html.Pre(error_message),
-            ]
-        )
-    global_df = local_vars["df"]  # Update the global dataframe from the local variables
-    print(global_df.head())
-    return html.Div(
-        [
-            html.Pre(global_df.head().to_string(index=False)),
-            html.H6(f"Ask about Transformed Data"),
-            dbc.InputGroup(
+        error_message = _error_message(e)
+        return (
+            html.Div(
                 [
-                    dbc.Textarea(
-                        id="question-transformed-data",
-                        placeholder="Enter question about transformed data...",
-                    ),
-                    dbc.Button("Ask", id="question-transformed-data-button"),
-                ],
-                className="mb-3",
-            ),
-            dbc.Textarea(
-                id="answer-transformed-data",
-                placeholder="Answer...",
+                    html.H5("Error"),
+                    html.Pre(error_message),
+                ]
             ),
-        ]
+            dash.no_update,
+        )
+    print(df.head())
+    return (
+        html.Div(
+            [
+                html.Pre(df.head().to_string(index=False)),
+                html.H6(f"Ask about Transformed Data"),
+                dbc.InputGroup(
+                    [
+                        dbc.Textarea(
+                            id="question-transformed-data",
+                            placeholder="Enter question about transformed data...",
+                        ),
+                        dbc.Button("Ask", id="question-transformed-data-button"),
+                    ],
+                    className="mb-3",
+                ),
+                dbc.Textarea(
+                    id="answer-transformed-data",
+                    placeholder="Answer...",
+                ),
+            ]
+        ),
+        cells,
     )
 
 
+@app.callback(
+    [Output("pipeline-view", "children"), Output("cell-select", "options")],
+    [Input("pipeline-cells", "data")],
+)
+def update_pipeline_view(cells):
+    cells = cells or []
+    options = [{"label": f"Cell {i + 1}", "value": i} for i in range(len(cells))]
+    options.append({"label": "New cell", "value": -1})
+    return html.Ol([html.Li(html.Pre(code)) for code in cells]), options
+
+
+@app.callback(
+    Output("transform-code-input", "value"),
+    [Input("cell-select", "value")],
+    [State("pipeline-cells", "data")],
+    prevent_initial_call=True,
+)
+def select_cell(cell, cells):
+    # Loads the selected cell's code for editing
+    if cell is None or cell < 0 or cell >= len(cells or []):
+        return ""
+    return cells[cell]
+
+
 @app.callback(
     [Output("plot-output-status", "children"), Output("plot-output", "figure")],
     [Input("plot-button", "n_clicks")],
-    [State("plotly-code-input", "value")],
+    [State("plotly-code-input", "value"), State("session-id", "data")],
 )
-def update_graph(n, code):
-    global global_df
-    if n is None or code is None or global_df is None:
+def update_graph(n, code, session_id):
+    version = session_store.version(session_id, "df")
+    if n is None or code is None or version is None:
         return (html.Div(), go.Figure())
-    local_vars = {"df": global_df, "fig": None}
+    key = result_key("plot", version, code)
+    fig = result_cache.get(key)
+    if fig is not None:
+        return (html.Div(), fig)
     try:
-        exec(code, globals(), local_vars)  # Execute the plotting code
+        fig = sandbox.run(
+            code, session_store.path(session_id, "df"), output="fig", token=session_id
+        )
     except Exception as e:
-        error_message = f"{str(e)}\n\n{traceback.format_exc()}"
+        error_message = _error_message(e)
         return (
             html.Div(
                 [
@@ -220,7 +341,24 @@ def update_graph(n, code):
             ),
             go.Figure(),
         )
-    return (html.Div(), local_vars["fig"])
+    if fig is None:
+        return (html.Div(), go.Figure())
+    return (html.Div(), result_cache.put(key, fig))
+
+
+@app.callback(
+    Output("cancel-status", "children"),
+    [
+        Input("cancel-transform-button", "n_clicks"),
+        Input("cancel-plot-button", "n_clicks"),
+    ],
+    [State("session-id", "data")],
+    prevent_initial_call=True,
+)
+def cancel_code(transform_clicks, plot_clicks, session_id):
+    # Kills the worker processes running this session's code
+    cancelled = sandbox.cancel(session_id)
+    return f"Cancelled {cancelled} running job(s)." if cancelled else ""
 
 
 if __name__ == "__main__":
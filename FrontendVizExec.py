@@ -1,16 +1,28 @@
 import dash
 import dash_bootstrap_components as dbc  # Import Dash Bootstrap components
 from dash import dcc, html, Input, Output, State
-import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 import base64
-import io
+import traceback
+
+from dataset_cache import content_hash
+from ingest import read_csv
+from sandbox import Sandbox, SandboxError
+from session_store import SessionStore
 
 app = dash.Dash(
     __name__, external_stylesheets=[dbc.themes.BOOTSTRAP]
 )  # Import Bootstrap CSS
 
+# Plotly code runs in separate worker processes with a timeout and memory cap
+sandbox = Sandbox()
+# Parsed uploads as Arrow files keyed by content hash. Unlike FrontendVizManual,
+# which plots in this process from frames held in a DatasetCache, the code here
+# runs in sandbox worker processes, which memory-map these files instead of
+# receiving a pickled copy. Kept apart from the DatasetCache spill directories
+# so its size and TTL eviction only ever removes its own files.
+dataset_store = SessionStore("./cache/exec_datasets")
+
 app.layout = html.Div(
     [
         dbc.Row(
@@ -38,6 +50,8 @@ app.layout = html.Div(
             ]
         ),
         html.Div(id="output-data-upload"),
+        # Only this id goes back to the server on Plot, not the file contents
+        dcc.Store(id="dataset-id"),
         dbc.InputGroup(
             [
                 dbc.Input(
@@ -49,6 +63,7 @@ app.layout = html.Div(
             ],
             className="mb-3",
         ),
+        html.Div(id="plot-output-status"),
         dcc.Graph(id="plot-output"),
     ],
     className="p-5",  # padding
@@ -58,34 +73,70 @@ app.layout = html.Div(
 def parse_contents(contents):
     content_type, content_string = contents.split(",")
     decoded = base64.b64decode(content_string)
-    return pd.read_csv(io.StringIO(decoded.decode("utf-8")))
+    return read_csv(decoded)
+
+
+def load_dataset(contents):
+    # Parses an upload once; the same file uploaded again reuses the stored frame
+    key = content_hash(contents)
+    df = dataset_store.get(key, "df")
+    if df is None:
+        df = dataset_store.put(key, "df", parse_contents(contents), version=key)
+    return key, df
 
 
 @app.callback(
-    Output("output-data-upload", "children"),
+    [Output("output-data-upload", "children"), Output("dataset-id", "data")],
     [Input("upload-data", "contents")],
 )
 def update_output(contents):
     if contents is None:
-        return
-    df = parse_contents(contents)
-    return html.Div([html.H5("Data"), html.Pre(df.head().to_string(index=False))])
+        return None, None
+    key, df = load_dataset(contents)
+    return (
+        html.Div([html.H5("Data"), html.Pre(df.head().to_string(index=False))]),
+        key,
+    )
+
+
+def _error_message(e):
+    if isinstance(e, SandboxError):
+        return str(e)  # Already holds the traceback from the worker process
+    return f"{str(e)}\n\n{traceback.format_exc()}"
 
 
 @app.callback(
-    Output("plot-output", "figure"),
+    [Output("plot-output-status", "children"), Output("plot-output", "figure")],
     [Input("plot-button", "n_clicks")],
     [
-        State("upload-data", "contents"),
+        State("dataset-id", "data"),
         State("plotly-code-input", "value"),
     ],
 )
-def update_graph(n, contents, code):
-    if n is None or contents is None or code is None:
-        return go.Figure()
-    df = parse_contents(contents)
-    exec(code, globals(), locals())
-    return locals()["fig"]
+def update_graph(n, dataset_id, code):
+    if n is None or dataset_id is None or code is None:
+        return html.Div(), go.Figure()
+    # The stored frame may have been evicted since the upload
+    if dataset_store.version(dataset_id, "df") is None:
+        return html.Div(), go.Figure(
+            layout={"title": "Data expired, please upload the file again"}
+        )
+    try:
+        fig = sandbox.run(code, dataset_store.path(dataset_id, "df"), output="fig")
+    except Exception as e:
+        error_message = _error_message(e)
+        return (
+            html.Div(
+                [
+                    html.H5("Error"),
+                    html.Pre(error_message),
+                ]
+            ),
+            go.Figure(),
+        )
+    if fig is None:
+        return html.Div(), go.Figure()
+    return html.Div(), fig
 
 
 if __name__ == "__main__":
@@ -5,7 +5,12 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import base64
-import io
+import functools
+
+from aggregate import AGGREGATIONS, GroupIndex, numeric_columns
+from dataset_cache import DatasetCache, content_hash
+from figure_patch import FigureDiffer
+from ingest import read_csv
 
 app = dash.Dash(
     __name__,
@@ -13,6 +18,11 @@ app = dash.Dash(
     suppress_callback_exceptions=True,
 )
 
+# Parsed uploads keyed by content hash
+dataset_cache = DatasetCache("./cache/datasets")
+# Figures sent to the browser, so the next one can go out as a Patch
+figure_differ = FigureDiffer()
+
 
 app.layout = html.Div(
     [
@@ -41,6 +51,8 @@ app.layout = html.Div(
             ]
         ),
         html.Div(id="output-data-upload"),
+        # Only this id goes back to the server on Plot, not the file contents
+        dcc.Store(id="dataset-id"),
         dbc.InputGroup(
             [
                 dbc.Select(
@@ -48,11 +60,16 @@ app.layout = html.Div(
                     options=[],
                     value=None,
                 ),
+                dbc.Select(
+                    id="value-select",
+                    options=[],
+                    value=None,
+                ),
                 dbc.RadioItems(
                     id="agg-select",
                     options=[
-                        {"label": "Sum", "value": "sum"},
-                        {"label": "Mean", "value": "mean"},
+                        {"label": agg.capitalize(), "value": agg}
+                        for agg in AGGREGATIONS
                     ],
                     value="sum",
                     inline=True,
@@ -71,6 +88,8 @@ app.layout = html.Div(
             className="mb-3",
         ),
         dcc.Graph(id="plot-output"),
+        # Version id of the figure currently shown in plot-output
+        dcc.Store(id="plot-version"),
     ],
     className="p-5",
 )
@@ -79,24 +98,41 @@ app.layout = html.Div(
 def parse_contents(contents):
     content_type, content_string = contents.split(",")
     decoded = base64.b64decode(content_string)
-    return pd.read_csv(io.StringIO(decoded.decode("utf-8")))
+    return read_csv(decoded)
+
+
+def load_dataset(contents):
+    # Parses an upload once; the same file uploaded again reuses the cached frame
+    key = content_hash(contents)
+    df = dataset_cache.get(key)
+    if df is None:
+        df = dataset_cache.put(key, parse_contents(contents), persist=True)
+    return key, df
 
 
 @app.callback(
-    dash.dependencies.Output("output-data-upload", "children"),
+    [
+        dash.dependencies.Output("output-data-upload", "children"),
+        dash.dependencies.Output("dataset-id", "data"),
+    ],
     [dash.dependencies.Input("upload-data", "contents")],
 )
 def update_output(contents):
     if contents is None:
-        return
-    df = parse_contents(contents)
+        return None, None
+    key, df = load_dataset(contents)
     columns = [{"label": col, "value": col} for col in df.columns]
-    return html.Div(
-        [
-            html.H5("Data"),
-            html.Pre(df.head().to_string(index=False)),
-            dcc.Store(id="column-options", data=columns),
-        ]
+    values = [{"label": col, "value": col} for col in numeric_columns(df)]
+    return (
+        html.Div(
+            [
+                html.H5("Data"),
+                html.Pre(df.head().to_string(index=False)),
+                dcc.Store(id="column-options", data=columns),
+                dcc.Store(id="value-options", data=values),
+            ]
+        ),
+        key,
     )
 
 
@@ -109,34 +145,68 @@ def update_column_options(columns):
 
 
 @app.callback(
-    dash.dependencies.Output("plot-output", "figure"),
+    [
+        dash.dependencies.Output("value-select", "options"),
+        dash.dependencies.Output("value-select", "value"),
+    ],
+    [dash.dependencies.Input("value-options", "data")],
+)
+def update_value_options(values):
+    return values, values[0]["value"] if values else None
+
+
+def group_index(dataset_id, column):
+    # Group codes are built once per dataset and key column, then shared by
+    # every value column and aggregation
+    key = f"{dataset_id}_groups_{content_hash(str(column))}"
+    index = dataset_cache.get(key)
+    if index is None:
+        df = dataset_cache.get(dataset_id)
+        index = dataset_cache.put(key, GroupIndex(df[column]))
+    return index
+
+
+@functools.lru_cache(maxsize=256)
+def aggregate(dataset_id, column, value_column, agg):
+    # The aggregated column gets its own name, so grouping a column by itself
+    # (e.g. count of Year per Year) keeps both columns
+    index = group_index(dataset_id, column)
+    values = dataset_cache.get(dataset_id)[value_column]
+    return pd.DataFrame(
+        {column: index.keys, f"{agg}({value_column})": index.aggregate(values, agg)}
+    )
+
+
+@app.callback(
+    [
+        dash.dependencies.Output("plot-output", "figure"),
+        dash.dependencies.Output("plot-version", "data"),
+    ],
     [dash.dependencies.Input("plot-button", "n_clicks")],
     [
-        dash.dependencies.State("upload-data", "contents"),
+        dash.dependencies.State("dataset-id", "data"),
         dash.dependencies.State("column-select", "value"),
+        dash.dependencies.State("value-select", "value"),
         dash.dependencies.State("agg-select", "value"),
         dash.dependencies.State("graph-select", "value"),
+        dash.dependencies.State("plot-version", "data"),
     ],
 )
-def update_graph(n, contents, column, agg, graph_type):
-    if n is None or contents is None or column is None:
-        return go.Figure()
-    df = parse_contents(contents)
-
-    # Ensure the column data is numeric
-    try:
-        df[column] = pd.to_numeric(df[column], errors="coerce")
-    except Exception as e:
-        return html.Div(f"Error: Unable to convert column data to numeric. {e}")
-    if agg == "sum":
-        agg_df = df.groupby(column).sum().reset_index()
-    else:
-        agg_df = df.groupby(column).mean().reset_index()
+def update_graph(n, dataset_id, column, value_column, agg, graph_type, version):
+    if n is None or dataset_id is None or column is None or value_column is None:
+        return go.Figure(), None
+    if dataset_id not in dataset_cache:
+        return go.Figure(), None
+    # Only the small aggregated table is built here; the full frame is not copied
+    agg_df = aggregate(dataset_id, column, value_column, agg)
+    y = f"{agg}({value_column})"
+    labels = {y: f"{agg} of {value_column}"}
     if graph_type == "bar":
-        fig = px.bar(agg_df, x=column, y=agg_df.columns[1])
+        fig = px.bar(agg_df, x=column, y=y, labels=labels)
     else:
-        fig = px.line(agg_df, x=column, y=agg_df.columns[1])
-    return fig
+        fig = px.line(agg_df, x=column, y=y, labels=labels)
+    # Switching the aggregation or graph type only sends the changed parts
+    return figure_differ.update(fig, version)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+AGGREGATIONS = ["sum", "mean", "count", "min", "max"]
+
+
+class GroupIndex:
+    # Group codes of one key column, computed once per dataset and reused for
+    # every value column and aggregation. Rows whose key is missing are left
+    # out, like groupby(dropna=True).
+
+    def __init__(self, keys):
+        codes, self.keys = pd.factorize(keys, sort=True)
+        valid = codes >= 0
+        self.rows = None if valid.all() else np.flatnonzero(valid)
+        self.codes = codes if self.rows is None else codes[valid]
+        # Rows ordered by group, and where each group starts in that order,
+        # for the min/max kernels (np.fmin.reduceat)
+        self.order = np.argsort(self.codes, kind="stable")
+        self.starts = np.searchsorted(self.codes[self.order], np.arange(len(self.keys)))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __sizeof__(self):
+        arrays = [self.codes, self.order, self.starts]
+        if self.rows is not None:
+            arrays.append(self.rows)
+        return sum(a.nbytes for a in arrays) + self.keys.memory_usage(deep=True)
+
+    def aggregate(self, values, how):
+        # NaN values are skipped like in pandas: sum of nothing is 0, mean, min
+        # and max of nothing are NaN
+        values = np.asarray(values, dtype=np.float64)
+        if self.rows is not None:
+            values = values[self.rows]
+        n_groups = len(self)
+        present = ~np.isnan(values)
+        if how == "count":
+            return np.bincount(self.codes, weights=present, minlength=n_groups)
+        if how in ("sum", "mean"):
+            sums = np.bincount(
+                self.codes, weights=np.where(present, values, 0), minlength=n_groups
+            )
+            if how == "sum":
+                return sums
+            counts = np.bincount(self.codes, weights=present, minlength=n_groups)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return sums / counts
+        if how in ("min", "max"):
+            if n_groups == 0:
+                return np.empty(0)
+            ufunc = np.fmin if how == "min" else np.fmax
+            return ufunc.reduceat(values[self.order], self.starts)
+        raise ValueError(f"Unknown aggregation: {how}")
+
+
+def numeric_columns(df):
+    return [
+        column
+        for column in df.columns
+        if pd.api.types.is_numeric_dtype(df[column])
+        and not pd.api.types.is_bool_dtype(df[column])
+    ]
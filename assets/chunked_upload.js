@@ -0,0 +1,80 @@
+// ファイルを分割して /upload/<id> に送る。dcc.Upload のように base64 の data URL を
+// ブラウザのメモリに作らず、File.slice で切り出した分だけを順に送信する。
+// 送信状況は window.chunkedUploadState に書き込み、Dash 側は
+// interval-component の clientside callback でそれを読み取る。
+(function () {
+    var CHUNK_SIZE = 8 * 1024 * 1024;
+    var MAX_RETRIES = 5;
+
+    function setState(message, result) {
+        window.chunkedUploadState = {
+            message: message,
+            result: result || (window.chunkedUploadState || {}).result,
+        };
+    }
+
+    function uploadId(file) {
+        // 同じファイルなら同じ id になるので、中断しても続きから再開できる
+        var raw = [file.name, file.size, file.lastModified].join("-");
+        return raw.replace(/[^A-Za-z0-9_-]/g, "_").slice(-128);
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    async function sendChunk(url, received, chunk) {
+        for (var attempt = 0; ; attempt++) {
+            try {
+                var response = await fetch(url + "?offset=" + received, {
+                    method: "PUT",
+                    body: chunk,
+                });
+                // 409 はサーバー側の受信済みサイズとずれている場合。返ってきた位置から続ける
+                if (response.ok || response.status === 409) {
+                    return (await response.json()).received;
+                }
+            } catch (err) {
+                if (attempt >= MAX_RETRIES) { throw err; }
+            }
+            if (attempt >= MAX_RETRIES) {
+                throw new Error("upload failed");
+            }
+            await sleep(1000 * Math.pow(2, attempt));
+        }
+    }
+
+    async function uploadFile(file) {
+        var url = "/upload/" + uploadId(file);
+        var received = (await (await fetch(url)).json()).received;
+        while (received < file.size) {
+            setState("Uploading " + file.name + ": " +
+                Math.floor(100 * received / file.size) + "%");
+            var chunk = file.slice(received, received + CHUNK_SIZE);
+            received = await sendChunk(url, received, chunk);
+        }
+        setState("Processing " + file.name + "...");
+        var response = await fetch(url + "/complete", {
+            method: "POST",
+            headers: {"Content-Type": "application/json"},
+            body: JSON.stringify({filename: file.name, content_type: file.type}),
+        });
+        setState("Uploaded " + file.name, await response.json());
+    }
+
+    document.addEventListener("click", function (event) {
+        if (!event.target.closest("#chunked-upload-button")) {
+            return;
+        }
+        var input = document.createElement("input");
+        input.type = "file";
+        input.addEventListener("change", function () {
+            if (input.files.length) {
+                uploadFile(input.files[0]).catch(function (err) {
+                    setState("Upload failed: " + err.message);
+                });
+            }
+        });
+        input.click();
+    });
+})();
@@ -0,0 +1,163 @@
+import contextlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+
+import pandas as pd
+
+
+CATALOG_PATH = "./catalog.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    path TEXT NOT NULL,
+    num_rows INTEGER NOT NULL,
+    num_bytes INTEGER NOT NULL,
+    uploaded_at TEXT NOT NULL,
+    content_hash TEXT,
+    schema TEXT NOT NULL,
+    stats TEXT NOT NULL,
+    preview TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS datasets_content_hash ON datasets (content_hash);
+CREATE VIRTUAL TABLE IF NOT EXISTS datasets_fts USING fts5(name, columns);
+"""
+
+
+def column_stats(df):
+    stats = {}
+    for column in df.columns:
+        series = df[column]
+        entry = {
+            "nulls": int(series.isna().sum()),
+            "distinct": int(series.nunique()),
+        }
+        if pd.api.types.is_numeric_dtype(series) and series.notna().any():
+            entry.update(
+                min=float(series.min()),
+                max=float(series.max()),
+                mean=float(series.mean()),
+            )
+        stats[str(column)] = entry
+    return stats
+
+
+def frame_schema(df):
+    return [{"name": str(c), "type": str(t)} for c, t in df.dtypes.items()]
+
+
+def _fts_query(text):
+    # Every word becomes a prefix term, e.g. "car da" -> "car"* "da"*
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class DatasetCatalog:
+    # Index of stored datasets (schema, row count, size, column statistics and a
+    # small preview) so that listing and searching never open the data files.
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, name, path, df, num_rows=None, content_hash=None, preview=None):
+        # df may be the full frame (upload) or just the first rows (backfill), so
+        # num_rows and preview can be given separately.
+        if preview is None:
+            preview = df.head(5)
+        record = {
+            "name": name,
+            "path": path,
+            "num_rows": len(df) if num_rows is None else num_rows,
+            "num_bytes": os.path.getsize(path),
+            "uploaded_at": _now(),
+            "content_hash": content_hash,
+            "schema": json.dumps(frame_schema(df)),
+            "stats": json.dumps(column_stats(df)),
+            "preview": preview.to_json(orient="records", date_format="iso"),
+        }
+        self._insert(record, df.columns)
+
+    def add_alias(self, name, path, dataset):
+        # Another name for already stored content; schema, stats and preview are
+        # copied from the existing dataset row instead of being recomputed.
+        record = {
+            key: dataset[key]
+            for key in ("num_rows", "num_bytes", "content_hash", "schema", "stats")
+        }
+        record.update(
+            name=name, path=path, uploaded_at=_now(), preview=dataset["preview"]
+        )
+        columns = [column["name"] for column in json.loads(dataset["schema"])]
+        self._insert(record, columns)
+
+    def _insert(self, record, columns):
+        with self._connect() as conn:
+            old = conn.execute(
+                "SELECT id FROM datasets WHERE name = ?", (record["name"],)
+            ).fetchone()
+            if old is not None:
+                conn.execute("DELETE FROM datasets WHERE id = ?", (old["id"],))
+                conn.execute("DELETE FROM datasets_fts WHERE rowid = ?", (old["id"],))
+            cursor = conn.execute(
+                f"INSERT INTO datasets ({', '.join(record)}) "
+                f"VALUES ({', '.join('?' * len(record))})",
+                list(record.values()),
+            )
+            conn.execute(
+                "INSERT INTO datasets_fts (rowid, name, columns) VALUES (?, ?, ?)",
+                (cursor.lastrowid, record["name"], " ".join(str(c) for c in columns)),
+            )
+
+    def find_by_hash(self, content_hash):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM datasets WHERE content_hash = ? LIMIT 1",
+                (content_hash,),
+            ).fetchone()
+        return None if row is None else dict(row)
+
+    def names(self):
+        with self._connect() as conn:
+            return {row["name"] for row in conn.execute("SELECT name FROM datasets")}
+
+    def search(self, text=None, limit=20, offset=0):
+        # Name prefix matches (unique NOCASE name index) plus full-text matches on
+        # words of the name and column names. Returns (rows, total count).
+        where, params = "", []
+        fts_query = _fts_query(text or "")
+        if fts_query:
+            where = (
+                "WHERE name LIKE ? ESCAPE '\\' OR id IN "
+                "(SELECT rowid FROM datasets_fts WHERE datasets_fts MATCH ?)"
+            )
+            escaped = re.sub(r"([%_\\])", r"\\\1", text)
+            params = [f"{escaped}%", fts_query]
+        with self._connect() as conn:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM datasets {where}", params
+            ).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM datasets {where} ORDER BY name LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [dict(row) for row in rows], total
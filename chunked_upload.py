@@ -0,0 +1,86 @@
+import hashlib
+import os
+import re
+
+from flask import abort, jsonify, request
+
+
+SPOOL_DIR = "./cache/uploads"
+MAX_SPOOL_BYTES = 20 * 2**30
+READ_SIZE = 2**20
+
+_UPLOAD_ID = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+def _partial_path(spool_dir, upload_id):
+    if not _UPLOAD_ID.match(upload_id):
+        abort(400)
+    return os.path.join(spool_dir, f"{upload_id}.part")
+
+
+def spool_path(key, spool_dir=SPOOL_DIR):
+    # 完了したアップロードは内容のハッシュをファイル名にして保存している
+    return os.path.join(spool_dir, key)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def trim_spool(spool_dir=SPOOL_DIR, max_bytes=MAX_SPOOL_BYTES):
+    files = []
+    for name in os.listdir(spool_dir):
+        stat = os.stat(os.path.join(spool_dir, name))
+        files.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in files)
+    for _, size, name in sorted(files):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(spool_dir, name))
+        total -= size
+
+
+def register_upload_routes(server, spool_dir=SPOOL_DIR):
+    # dcc.Upload を使わずに、ブラウザからファイルを分割して送るためのルート。
+    # 受信したチャンクはそのままディスク上のファイルに追記するので、
+    # サーバーのメモリ使用量はファイルサイズに依存しない。
+    os.makedirs(spool_dir, exist_ok=True)
+
+    @server.route("/upload/<upload_id>", methods=["GET"])
+    def upload_status(upload_id):
+        # 途中まで送ったファイルは、受信済みのバイト数から再開できる
+        path = _partial_path(spool_dir, upload_id)
+        received = os.path.getsize(path) if os.path.exists(path) else 0
+        return jsonify(received=received)
+
+    @server.route("/upload/<upload_id>", methods=["PUT"])
+    def upload_chunk(upload_id):
+        path = _partial_path(spool_dir, upload_id)
+        received = os.path.getsize(path) if os.path.exists(path) else 0
+        offset = request.args.get("offset", type=int)
+        if offset != received:
+            return jsonify(received=received), 409
+        with open(path, "ab") as f:
+            for block in iter(lambda: request.stream.read(READ_SIZE), b""):
+                f.write(block)
+            received = f.tell()
+        return jsonify(received=received)
+
+    @server.route("/upload/<upload_id>/complete", methods=["POST"])
+    def upload_complete(upload_id):
+        path = _partial_path(spool_dir, upload_id)
+        if not os.path.exists(path):
+            abort(404)
+        info = request.get_json(silent=True) or {}
+        key = file_hash(path)
+        os.replace(path, spool_path(key, spool_dir))
+        trim_spool(spool_dir)
+        return jsonify(
+            key=key,
+            filename=info.get("filename", ""),
+            content_type=info.get("content_type", ""),
+        )
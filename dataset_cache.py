@@ -0,0 +1,106 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def sizeof(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sum(sizeof(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(sizeof(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, "to_plotly_json"):
+        # plotly figures keep their data arrays in nested dicts
+        return sizeof(value.to_plotly_json())
+    return sys.getsizeof(value)
+
+
+class DatasetCache:
+    # Keeps parsed datasets in memory up to max_bytes. The least recently used
+    # entries are spilled to spill_dir as pickles and loaded back on the next hit,
+    # and the spill directory itself is trimmed to max_disk_bytes by mtime.
+
+    def __init__(self, spill_dir, max_bytes=512 * 2**20, max_disk_bytes=4 * 2**30):
+        self.spill_dir = spill_dir
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.pkl")
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries or os.path.exists(self._spill_path(key))
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        path = self._spill_path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value, persist=False):
+        # persist=True writes the entry to spill_dir right away, so a value built in
+        # another process (e.g. a background callback) is visible to the server.
+        size = sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, (old_value, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self._spill(old_key, old_value)
+        if persist:
+            self._spill(key, value)
+        return value
+
+    def _spill(self, key, value):
+        path = self._spill_path(key)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.spill_dir):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.spill_dir, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(os.path.join(self.spill_dir, name))
+            total -= size
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+# これより多くの点を描くときは SVG ではなく WebGL (scattergl) を使う
+# (plotly.express の render_mode="auto" と同じ閾値)
+WEBGL_THRESHOLD = 1000
+# 1ピクセルあたりに残す点の数
+POINTS_PER_PIXEL = 2
+DEFAULT_WIDTH = 1000
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets。x でソート済みの点列から n_out 点を選び、
+    # 選んだ点のインデックスを返す
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    if x.dtype.kind == "M":
+        x = x.view(np.int64)
+    x = x.astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # 先頭と末尾を除いた点を n_out - 2 個のバケットに分ける
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # 直前に選んだ点と次のバケットの平均点で作る三角形の面積が最大の点を選ぶ
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def target_points(width):
+    return POINTS_PER_PIXEL * int(width or DEFAULT_WIDTH)
+
+
+def downsample(x, y, width, x_range=None):
+    # x_range (表示範囲) に入る点だけを取り出し、画面の幅に見合う点数まで間引く。
+    # x は昇順にソートされている前提
+    if x_range is not None:
+        start = np.searchsorted(x, x_range[0])
+        end = np.searchsorted(x, x_range[1], side="right")
+        x, y = x[start:end], y[start:end]
+    index = lttb(x, y, target_points(width))
+    return x[index], y[index], len(x)
+
+
+def render_mode(n_points):
+    return "webgl" if n_points > WEBGL_THRESHOLD else "svg"
@@ -0,0 +1,47 @@
+import ast
+
+from dataset_cache import content_hash
+
+
+def normalize_code(code):
+    # The AST dump ignores comments, blank lines and formatting, so code that
+    # only differs in those shares one cache entry
+    try:
+        return ast.dump(ast.parse(code))
+    except SyntaxError:
+        return code
+
+
+def result_key(kind, data_version, code):
+    # Cache key of running code (kind is e.g. "transform" or "plot") on the
+    # dataset identified by data_version
+    return content_hash(f"{kind}\0{data_version}\0{normalize_code(code)}")
+
+
+def pipeline_keys(source_version, cells):
+    # Each cell's key chains the key of the cell before it, so it identifies the
+    # source data plus the code of every cell up to and including this one
+    keys = []
+    key = source_version
+    for code in cells:
+        key = result_key("transform", key, code)
+        keys.append(key)
+    return keys
+
+
+def run_pipeline(cells, source_version, source, run_cell, cache):
+    # Returns (output of the last cell, its key). A cell is only run when its
+    # output is not in cache, so after cell N is edited the cells before it are
+    # read from the cache and only N onward are executed again.
+    # run_cell(code, data) runs one cell on the previous output (or source).
+    keys = pipeline_keys(source_version, cells)
+
+    def output(i):
+        if i < 0:
+            return source
+        df = cache.get(keys[i])
+        if df is None:
+            df = cache.put(keys[i], run_cell(cells[i], output(i - 1)))
+        return df
+
+    return output(len(cells) - 1), keys[-1] if keys else source_version
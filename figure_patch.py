@@ -0,0 +1,87 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+import dash
+import numpy as np
+
+
+MAX_FIGURES = 1024
+
+
+def _equal(a, b):
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        a, b = np.asarray(a), np.asarray(b)
+        return a.shape == b.shape and a.dtype == b.dtype and np.array_equal(a, b)
+    return type(a) is type(b) and a == b
+
+
+def _diff(old, new, patch):
+    # Writes the operations turning old into new (both figure dicts) into patch,
+    # recursing into dicts and into lists of dicts such as data traces.
+    # Returns whether anything changed.
+    changed = False
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+            changed = True
+            continue
+        before = old[key]
+        if isinstance(value, dict) and isinstance(before, dict):
+            changed |= _diff(before, value, patch[key])
+        elif (
+            isinstance(value, (list, tuple))
+            and isinstance(before, (list, tuple))
+            and len(value) == len(before)
+            and all(isinstance(v, dict) for v in value)
+            and all(isinstance(v, dict) for v in before)
+        ):
+            for i, (item_before, item) in enumerate(zip(before, value)):
+                changed |= _diff(item_before, item, patch[key][i])
+        elif not _equal(before, value):
+            patch[key] = value
+            changed = True
+    for key in old.keys() - new.keys():
+        del patch[key]
+        changed = True
+    return changed
+
+
+def _to_dict(figure):
+    if hasattr(figure, "to_plotly_json"):
+        return figure.to_plotly_json()
+    return figure
+
+
+class FigureDiffer:
+    # Remembers recently sent figures by a version id that the client keeps in a
+    # dcc.Store next to the graph. When the client's version is known, the next
+    # figure is sent as a dash.Patch with only the parts that differ (e.g. the y
+    # array and title) instead of the whole figure. An unknown version (evicted,
+    # or sent by another worker process) falls back to the full figure.
+
+    def __init__(self, max_figures=MAX_FIGURES):
+        self.max_figures = max_figures
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, figure):
+        # Returns the version id of a figure sent in full
+        version = uuid.uuid4().hex
+        with self._lock:
+            self._figures[version] = _to_dict(figure)
+            while len(self._figures) > self.max_figures:
+                self._figures.popitem(last=False)
+        return version
+
+    def update(self, figure, client_version):
+        # Returns (what to send: the figure, a Patch or dash.no_update, and the
+        # version id the client should keep)
+        with self._lock:
+            before = self._figures.get(client_version)
+        if before is None:
+            return figure, self.remember(figure)
+        patch = dash.Patch()
+        if not _diff(before, _to_dict(figure), patch):
+            return dash.no_update, client_version
+        return patch, self.remember(figure)
@@ -0,0 +1,214 @@
+from lxml import etree
+import numpy as np
+import pandas as pd
+
+
+TILE_SIZE = 256
+MAX_ZOOM = 18
+# 許容誤差 (画面上のピクセル数)。これ以下のずれは地図上で見分けられない
+TOLERANCE_PIXELS = 1.0
+# on_progress を呼ぶ間隔 (読み込んだ点の数)
+PROGRESS_INTERVAL = 100_000
+
+
+def to_mercator(coords):
+    # [lat, lon] の配列を Web Mercator の正規化座標 (0..1) に変換する
+    lat = np.radians(np.clip(coords[:, 0], -85.0511, 85.0511))
+    x = (coords[:, 1] + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return np.column_stack([x, y])
+
+
+class _GrowableArray:
+    # 容量を倍々に増やしながら行を追加していく NumPy 配列
+
+    def __init__(self, shape, dtype, capacity=4096):
+        self._data = np.empty((capacity, *shape), dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, row):
+        if self._size == len(self._data):
+            grown = np.empty(
+                (2 * len(self._data), *self._data.shape[1:]), self._data.dtype
+            )
+            grown[: self._size] = self._data
+            self._data = grown
+        self._data[self._size] = row
+        self._size += 1
+
+    def view(self):
+        return self._data[: self._size]
+
+
+class TrackGeometry:
+    # GPX ファイル内のすべてのトラック・セグメントを1つの (N, 3) [lat, lon, ele] 配列で持ち、
+    # 各セグメントはその配列のビュー ((n, 2) の [lat, lon]) として扱う
+
+    def __init__(self, points, offsets, times=None):
+        self._points = points
+        self._offsets = offsets
+        self.times = times
+        self._build_segments()
+
+    def _build_segments(self):
+        bounds = zip(self._offsets[:-1], self._offsets[1:])
+        self.segments = [self._points[s:e, :2] for s, e in bounds if e > s]
+
+    def __getstate__(self):
+        # セグメントはビューなので、キャッシュに書き出すときは元の配列だけを保存する
+        state = self.__dict__.copy()
+        del state["segments"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_segments()
+
+    def __len__(self):
+        return len(self.segments)
+
+    @property
+    def points(self):
+        return self._points[:, :2]
+
+    def frame(self):
+        df = pd.DataFrame(
+            self._points, columns=["Latitude", "Longitude", "Elevation"], copy=False
+        )
+        if self.times is not None:
+            df["Time"] = self.times
+        return df
+
+    def bounds(self):
+        points = self.points
+        south, west = points.min(axis=0)
+        north, east = points.max(axis=0)
+        return [[float(south), float(west)], [float(north), float(east)]]
+
+    def center(self):
+        (south, west), (north, east) = self.bounds()
+        return [(south + north) / 2, (west + east) / 2]
+
+    def fit_zoom(self, map_width, map_height):
+        # 全体が map_width x map_height ピクセルに収まる最大のズーム。
+        # 1点だけのトラックなど範囲が 0 の方向は MAX_ZOOM で頭打ちにする
+        (south, west), (north, east) = self.bounds()
+        corners = to_mercator(np.array([[north, west], [south, east]]))
+        x_range, y_range = np.abs(corners[1] - corners[0])
+        with np.errstate(divide="ignore"):
+            zoom_x = np.log2(map_width / (TILE_SIZE * x_range))
+            zoom_y = np.log2(map_height / (TILE_SIZE * y_range))
+        return float(np.clip(min(zoom_x, zoom_y), 0, MAX_ZOOM))
+
+
+def zoom_tolerance(zoom, pixels=TOLERANCE_PIXELS):
+    # ズームレベル zoom での pixels ピクセル分の長さ (正規化座標)
+    return pixels / (TILE_SIZE * 2.0**zoom)
+
+
+def simplify(coords, tolerance):
+    # Douglas-Peucker 法。区間ごとの距離計算は NumPy でまとめて行う
+    n = len(coords)
+    if n < 3:
+        return coords
+    points = to_mercator(coords)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[start + 1 : end]
+        origin = points[start]
+        direction = points[end] - origin
+        length = np.hypot(direction[0], direction[1])
+        offset = segment - origin
+        if length == 0:
+            distances = np.hypot(offset[:, 0], offset[:, 1])
+        else:
+            distances = (
+                np.abs(direction[0] * offset[:, 1] - direction[1] * offset[:, 0])
+                / length
+            )
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return coords[keep]
+
+
+def clip_to_bounds(coords, bounds, margin=0.5):
+    # 表示範囲 (上下左右に margin 倍だけ広げたもの) に入る部分だけを、
+    # 連続した区間ごとに切り出す。範囲をまたぐ線が途切れないよう前後の1点も残す
+    (south, west), (north, east) = bounds
+    lat_pad = (north - south) * margin
+    lon_pad = (east - west) * margin
+    inside = (
+        (coords[:, 0] >= south - lat_pad)
+        & (coords[:, 0] <= north + lat_pad)
+        & (coords[:, 1] >= west - lon_pad)
+        & (coords[:, 1] <= east + lon_pad)
+    )
+    mask = inside.copy()
+    mask[1:] |= inside[:-1]
+    mask[:-1] |= inside[1:]
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.view(np.int8), [0]])))
+    return [coords[start:end] for start, end in zip(edges[::2], edges[1::2])]
+
+
+def level_of_detail(segments, zoom, bounds=None):
+    # ズームに応じて間引いた折れ線 ([[lat, lon], ...] のリスト) を返す。
+    # 拡大時は表示範囲の周辺だけを細かく残すので、送るデータ量はほぼ一定になる
+    tolerance = zoom_tolerance(zoom)
+    positions = []
+    for segment in segments:
+        coords = np.asarray(segment, dtype=np.float64)
+        parts = [coords] if bounds is None else clip_to_bounds(coords, bounds)
+        for part in parts:
+            positions.append(simplify(part, tolerance).tolist())
+    return positions
+
+
+def _parse_time(text):
+    if not text:
+        return np.datetime64("NaT")
+    return np.datetime64(text.strip().rstrip("Z"), "ms")
+
+
+def read_gpx(source, on_progress=None):
+    # trkpt を1点ずつ読み、Python オブジェクトを残さずに配列へ書き込む。
+    # 読み終えた要素はすぐに破棄するので、ツリー全体をメモリに持たない。
+    # on_progress には PROGRESS_INTERVAL 点ごとに、それまでに読んだ点の数を渡す
+    points = _GrowableArray((3,), np.float64)
+    times = _GrowableArray((), "datetime64[ms]")
+    offsets = [0]
+    for _, elem in etree.iterparse(
+        source, events=("end",), tag=("{*}trkpt", "{*}trkseg"), huge_tree=True
+    ):
+        if etree.QName(elem).localname == "trkpt":
+            ele = elem.findtext("{*}ele")
+            points.append(
+                (
+                    float(elem.get("lat")),
+                    float(elem.get("lon")),
+                    float(ele) if ele else np.nan,
+                )
+            )
+            times.append(_parse_time(elem.findtext("{*}time")))
+            if on_progress is not None and len(points) % PROGRESS_INTERVAL == 0:
+                on_progress(len(points))
+        else:
+            offsets.append(len(points))
+        elem.clear()
+        parent = elem.getparent()
+        while elem.getprevious() is not None:
+            del parent[0]
+    if on_progress is not None:
+        on_progress(len(points))
+    return TrackGeometry(points.view(), offsets, times.view())
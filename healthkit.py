@@ -0,0 +1,200 @@
+import re
+
+from lxml import etree
+import numpy as np
+import pandas as pd
+
+
+WALKING_RUNNING_TYPE = "HKQuantityTypeIdentifierDistanceWalkingRunning"
+
+RECORD_FIELDS = [
+    "type",
+    "sourceName",
+    "sourceVersion",
+    "device",
+    "unit",
+    "creationDate",
+    "startDate",
+    "endDate",
+    "value",
+]
+
+GRANULARITIES = ["D", "W", "M", "Y"]
+
+DATE_FIELDS = ["creationDate", "startDate", "endDate"]
+
+CATEGORY_FIELDS = ["type", "sourceName", "sourceVersion", "device", "unit"]
+
+BATCH_SIZE = 50_000
+# on_progress を呼ぶ間隔 (処理した HealthData 直下の要素数)
+PROGRESS_INTERVAL = 100_000
+
+
+def _empty_batch(fields):
+    return {field: [] for field in fields}
+
+
+def _parse_dates(values):
+    # "2023-10-01 10:00:00 +0900" の先頭19文字 (端末のローカル時刻) だけを固定幅で
+    # 切り出して一括変換する。タイムゾーン付きで解析して strftime で落とすのと同じ結果になる。
+    return pd.to_datetime(
+        np.array(values, dtype="U19"), format="%Y-%m-%d %H:%M:%S", errors="coerce"
+    )
+
+
+def _to_frame(batch):
+    columns = {}
+    for field, values in batch.items():
+        if field in DATE_FIELDS:
+            columns[field] = _parse_dates(values)
+        elif field == "value":
+            columns[field] = pd.to_numeric(
+                pd.Series(values, dtype=object), errors="coerce"
+            ).astype(np.float32)
+        elif field in CATEGORY_FIELDS:
+            # 同じ文字列が何百万回も繰り返されるので辞書エンコードして持つ
+            columns[field] = pd.Categorical(values)
+        else:
+            columns[field] = values
+    return pd.DataFrame(columns)
+
+
+def iter_record_batches(
+    source, record_types, fields=RECORD_FIELDS, batch_size=BATCH_SIZE, on_progress=None
+):
+    # export.xml を逐次解析し、指定した type の Record だけを DataFrame のバッチで返す。
+    # HealthData 直下の要素は処理が終わるたびに破棄するので、メモリ使用量は
+    # ファイルサイズではなく batch_size に比例する。
+    # on_progress には PROGRESS_INTERVAL 要素ごとに、それまでに取り出した行数を渡す。
+    record_types = set(record_types)
+    depth = 0
+    batch = _empty_batch(fields)
+    rows = 0
+    total_rows = 0
+    processed = 0
+    for event, elem in etree.iterparse(
+        source, events=("start", "end"), huge_tree=True, resolve_entities=False
+    ):
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if elem.tag == "Record" and elem.get("type") in record_types:
+            for field in fields:
+                batch[field].append(elem.get(field))
+            rows += 1
+            total_rows += 1
+            if rows >= batch_size:
+                yield _to_frame(batch)
+                batch = _empty_batch(fields)
+                rows = 0
+        # 処理済みの要素と、ルートに残った兄弟要素への参照を解放する
+        elem.clear()
+        parent = elem.getparent()
+        while elem.getprevious() is not None:
+            del parent[0]
+        processed += 1
+        if on_progress is not None and processed % PROGRESS_INTERVAL == 0:
+            on_progress(total_rows)
+    if rows:
+        yield _to_frame(batch)
+    if on_progress is not None:
+        on_progress(total_rows)
+
+
+def _concat_batches(frames):
+    # バッチごとにカテゴリが異なると concat で object 型に戻ってしまうので、
+    # カテゴリ列は union_categoricals で結合する
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            columns[column] = pd.api.types.union_categoricals(parts)
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def read_records(
+    source, record_types, fields=RECORD_FIELDS, batch_size=BATCH_SIZE, on_progress=None
+):
+    frames = list(
+        iter_record_batches(source, record_types, fields, batch_size, on_progress)
+    )
+    if not frames:
+        frames = [_to_frame(_empty_batch(fields))]
+    df = _concat_batches(frames)
+    if "device" in df.columns:
+        df["simple_device"] = simple_device_names(df["device"])
+    return df
+
+
+def extract_device_name(device_info):
+    match = re.search(r"name:([^,]+),", str(device_info))
+    return match.group(1).strip() if match else None
+
+
+def simple_device_names(device):
+    # 正規表現は行ごとではなく、異なる device 文字列ごとに1回だけ実行する
+    device = device.astype("category")
+    names = device.cat.categories.map(extract_device_name)
+    name_codes, unique_names = pd.factorize(names, sort=True)
+    # 欠損 (-1) は末尾に足した -1 を引くようにして、そのまま欠損として残す
+    lookup = np.append(name_codes, -1)
+    return pd.Categorical.from_codes(lookup[device.cat.codes], unique_names)
+
+
+def _daily_totals(df):
+    # 行を1回だけ走査して (日, デバイス) ごとの合計と件数を求める。
+    # 以降の週・月・年の集計はこの小さな日次表から作る。
+    df = df.dropna(subset=["startDate", "value"])
+    days = df["startDate"].to_numpy().astype("datetime64[D]")
+    first_day, last_day = days.min(), days.max()
+    n_days = int((last_day - first_day).astype(int)) + 1
+    simple_device = df["simple_device"]
+    device_codes = simple_device.cat.codes.to_numpy().astype(np.int64)
+    devices = simple_device.cat.categories
+    n_cols = len(devices) + 1  # 0列目はデバイス名が取れなかった行
+    cells = (days - first_day).astype(np.int64) * n_cols + device_codes + 1
+    values = df["value"].to_numpy(dtype=np.float64)
+    size = n_days * n_cols
+    sums = np.bincount(cells, weights=values, minlength=size).reshape(n_days, n_cols)
+    counts = np.bincount(cells, minlength=size).reshape(n_days, n_cols)
+    day_index = first_day + np.arange(n_days)
+    return day_index, devices, sums, counts
+
+
+def build_rollups(df, granularities=GRANULARITIES):
+    # granularity ごとに、期間合計 (resample 相当) とデバイス別合計
+    # (groupby(["duration", "simple_device"]) 相当) を前計算する
+    rollups = {}
+    if not (df["startDate"].notna() & df["value"].notna()).any():
+        return rollups
+    day_index, devices, daily_sums, daily_counts = _daily_totals(df)
+    for freq in granularities:
+        periods = pd.period_range(day_index[0], day_index[-1], freq=freq)
+        starts = periods.start_time.to_numpy().astype("datetime64[D]")
+        bins = np.searchsorted(starts, day_index, side="right") - 1
+        sums = np.zeros((len(periods), daily_sums.shape[1]))
+        counts = np.zeros((len(periods), daily_sums.shape[1]), dtype=np.int64)
+        np.add.at(sums, bins, daily_sums)
+        np.add.at(counts, bins, daily_counts)
+
+        total = pd.DataFrame(
+            {
+                "startDate": periods.to_timestamp(how="end").normalize(),
+                "value": sums.sum(axis=1),
+            }
+        )
+        period_idx, device_idx = np.nonzero(counts[:, 1:])
+        by_device = pd.DataFrame(
+            {
+                "duration": periods[period_idx].astype(str),
+                "simple_device": devices[device_idx],
+                "value": sums[period_idx, device_idx + 1],
+            }
+        )
+        rollups[freq] = {"total": total, "by_device": by_device}
+    return rollups
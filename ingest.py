@@ -0,0 +1,146 @@
+import codecs
+import csv
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+
+# Bytes read from the start of the file to guess the encoding and delimiter
+SNIFF_BYTES = 64 * 1024
+# Tried in order; latin-1 decodes anything, so it is the last resort
+ENCODINGS = ["utf-8", "cp932", "latin-1"]
+DELIMITERS = ",\t;|"
+# Bytes per record batch when streaming (read_csv with on_progress, iter_csv)
+BLOCK_SIZE = 16 * 2**20
+# String columns whose distinct/total ratio is at or below this become categories
+CATEGORY_RATIO = 0.5
+
+
+def _open(source):
+    # source is a path, raw bytes or a binary file object
+    if isinstance(source, str):
+        return pa.OSFile(source, "rb")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return pa.BufferReader(source)
+    return source
+
+
+def _peek(stream):
+    position = stream.tell()
+    sample = stream.read(SNIFF_BYTES)
+    stream.seek(position)
+    return bytes(sample)
+
+
+def sniff_encoding(sample):
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8"  # Arrow skips the UTF-8 BOM itself
+    final = len(sample) < SNIFF_BYTES
+    for encoding in ENCODINGS:
+        try:
+            # The sample may end in the middle of a multibyte character
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=final)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return ENCODINGS[-1]
+
+
+def sniff_delimiter(text):
+    lines = text.splitlines()
+    if len(lines) > 1:
+        # Drop the last line, which may be cut off
+        lines = lines[:-1]
+    try:
+        return csv.Sniffer().sniff("\n".join(lines), delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        # A single column (or nothing recognizable) reads the same with ","
+        return ","
+
+
+def _options(stream, delimiter, encoding, block_size=None):
+    sample = _peek(stream)
+    if encoding is None:
+        encoding = sniff_encoding(sample)
+    if delimiter is None:
+        delimiter = sniff_delimiter(sample.decode(encoding, errors="ignore"))
+    read_options = pv.ReadOptions(use_threads=True, encoding=encoding)
+    if block_size is not None:
+        read_options.block_size = block_size
+    return read_options, pv.ParseOptions(delimiter=delimiter)
+
+
+def _open_reader(stream, delimiter, encoding, block_size):
+    read_options, parse_options = _options(stream, delimiter, encoding, block_size)
+    return pv.open_csv(stream, read_options=read_options, parse_options=parse_options)
+
+
+def compact_table(table, ratio=CATEGORY_RATIO):
+    # Dictionary encode repetitive string columns so they become pandas
+    # categoricals instead of one Python str object per cell
+    if table.num_rows == 0:
+        return table
+    for i, field in enumerate(table.schema):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            column = table.column(i)
+            if pc.count_distinct(column).as_py() <= ratio * table.num_rows:
+                table = table.set_column(i, field.name, pc.dictionary_encode(column))
+    return table
+
+
+def to_frame(table, categories=False):
+    if categories:
+        table = compact_table(table)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_csv(source, delimiter=None, encoding=None, categories=False, on_progress=None):
+    # Parses the bytes directly with Arrow's multithreaded CSV reader, without
+    # decoding the whole file into a Python str first. Column types are inferred
+    # by Arrow (int64 / float64 / bool / timestamp / string), and with
+    # categories=True low-cardinality string columns become pandas categoricals.
+    # With on_progress the file is read block by block and on_progress(rows) is
+    # called after each block. Streaming infers the column types from the first
+    # block only, so when a later block does not fit them the file is read again
+    # in one go, which gives the same result as without on_progress.
+    stream = _open(source)
+    try:
+        start = stream.tell()
+        table = None
+        if on_progress is not None:
+            try:
+                reader = _open_reader(stream, delimiter, encoding, BLOCK_SIZE)
+                batches = []
+                rows = 0
+                for batch in reader:
+                    batches.append(batch)
+                    rows += batch.num_rows
+                    on_progress(rows)
+                table = pa.Table.from_batches(batches, schema=reader.schema)
+            except pa.ArrowInvalid:
+                stream.seek(start)
+        if table is None:
+            read_options, parse_options = _options(stream, delimiter, encoding)
+            table = pv.read_csv(
+                stream, read_options=read_options, parse_options=parse_options
+            )
+            if on_progress is not None:
+                on_progress(table.num_rows)
+    finally:
+        if stream is not source:
+            stream.close()
+    return to_frame(table, categories)
+
+
+def iter_csv(source, block_size=BLOCK_SIZE, delimiter=None, encoding=None):
+    # Yields one DataFrame per block for files larger than memory. Column types
+    # are inferred from the first block, so a later block that does not fit them
+    # (e.g. text in a column that started out numeric) raises pa.ArrowInvalid.
+    stream = _open(source)
+    try:
+        for batch in _open_reader(stream, delimiter, encoding, block_size):
+            yield batch.to_pandas()
+    finally:
+        if stream is not source:
+            stream.close()
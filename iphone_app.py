@@ -1,19 +1,44 @@
 import base64
 import io
 import json
-import math
-import re
+import mimetypes
 
 import dash
-from dash import dcc, html, dash_table, Input, Output, State
+from dash import ctx, dcc, html, dash_table, DiskcacheManager, Input, Output, State
 import dash_leaflet as dl
-import gpxpy
+import diskcache
 from lxml import etree
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 
+from chunked_upload import register_upload_routes, spool_path
+from dataset_cache import DatasetCache, content_hash
+from downsample import downsample, render_mode
+from figure_patch import FigureDiffer
+from gpx_tracks import level_of_detail, read_gpx
+from healthkit import WALKING_RUNNING_TYPE, build_rollups, read_records
+from ingest import read_csv
+from paged_table import query_frame, table_columns
 
-app = dash.Dash(__name__)
+
+# 解析はバックグラウンドのプロセスで実行し、サーバーのワーカーを塞がないようにする
+background_callback_manager = DiskcacheManager(diskcache.Cache("./cache/jobs"))
+
+app = dash.Dash(
+    __name__,
+    suppress_callback_exceptions=True,
+    background_callback_manager=background_callback_manager,
+)
+# 大きなファイル用の分割アップロード (assets/chunked_upload.js から利用)
+register_upload_routes(app.server)
+
+TABLE_PAGE_SIZE = 1000
+
+# アップロード内容のハッシュをキーにした解析済みデータのキャッシュ
+dataset_cache = DatasetCache("./cache/datasets")
+# 送信済みの図を覚えておき、次の更新では差分 (Patch) だけを送る
+figure_differ = FigureDiffer()
 
 title_div = html.Div(
     children=html.H1("Apple Watch Data Visualization", style={"textAlign": "center"})
@@ -28,6 +53,30 @@ app.layout = html.Div(
             multiple=False,
             style={"width": "200px", "margin": "auto", "display": "block"},
         ),
+        # 数GBのエクスポートは分割アップロードでディスクに直接書き込む
+        html.Div(
+            [
+                html.Button("大きなファイルを選択", id="chunked-upload-button"),
+                html.Span(id="chunked-upload-status", style={"marginLeft": "10px"}),
+            ],
+            style={"width": "400px", "margin": "auto", "display": "block"},
+        ),
+        dcc.Store(id="chunked-upload"),
+        # 解析の進捗 (読み込んだバイト数と取り出した行数) とキャンセルボタン
+        html.Div(
+            [
+                html.Progress(id="parse-progress", value="0", max="1"),
+                html.Span(id="parse-progress-label", style={"marginLeft": "10px"}),
+                html.Button(
+                    "キャンセル",
+                    id="cancel-upload",
+                    disabled=True,
+                    style={"marginLeft": "10px"},
+                ),
+            ],
+            id="parse-progress-area",
+            style={"display": "none"},
+        ),
         dcc.Dropdown(
             id="time_dropdown",
             options=[
@@ -39,6 +88,7 @@ app.layout = html.Div(
             value="M",  # デフォルト値
             style={"width": "200px", "margin": "auto", "display": "block"},
         ),
+        dcc.Store(id="dataset-key"),
         dcc.Loading(
             id="loading",
             type="circle",
@@ -59,11 +109,6 @@ app.layout = html.Div(
 )
 
 
-def extract_device_name(device_info):
-    match = re.search(r"name:([^,]+),", str(device_info))
-    return match.group(1).strip() if match else None
-
-
 def add_row_number(df):
     df.reset_index(inplace=True)
     df.rename(columns={"index": "Row Number"}, inplace=True)
@@ -75,84 +120,192 @@ def process_csv(df):
     return df
 
 
-def parse_contents(contents, filename):
-    content_type, content_string = contents.split(",")
-    decoded = base64.b64decode(content_string)
-    data_str = decoded.decode("utf-8")
+def read_xml_elements(source):
+    # HealthKit 以外の XML は、すべての要素を tag / text / attributes の行にして表で表示する
+    root = etree.parse(source).getroot()
+    data = []
+    for item in root.iter():  # iterメソッドを使ってすべてのエレメントを反復処理
+        data.append(
+            {
+                "tag": item.tag,
+                "text": item.text,
+                "attributes": json.dumps(dict(item.attrib), ensure_ascii=False),
+            }
+        )
+    return pd.DataFrame(data, columns=["tag", "text", "attributes"])
+
 
+def parse_contents(source, filename, content_type, on_progress=None):
+    # source はファイルパス (分割アップロード) か BytesIO (dcc.Upload)
     if "csv" in filename:
-        # CSVファイルの場合
-        delimiter = "\0"
-        df = pd.read_csv(io.StringIO(data_str), delimiter=delimiter)
+        # CSVファイルの場合 (区切り文字と文字コードは先頭から推定する)
+        df = read_csv(source, categories=True, on_progress=on_progress)
         df = process_csv(df)
     elif "xls" in filename:
         # Excelファイルの場合
-        df = pd.read_excel(io.BytesIO(data_str))
+        df = pd.read_excel(source)
+    elif "xml" in filename and "text/xml" in content_type:
+        # export.xml を逐次解析し、対象の HealthKit Record だけを取り出す
+        # (グラフを描く update_output の text/xml 分岐と同じ条件)
+        df = read_records(source, [WALKING_RUNNING_TYPE], on_progress=on_progress)
     elif "xml" in filename:
-        # lxml.etreeを使ってXML文字列を解析
-        root = etree.fromstring(decoded)
-        data = []
-        for item in root.iter():  # iterメソッドを使ってすべてのエレメントを反復処理
-            data_elem = {
-                "tag": item.tag,
-                "text": item.text,
-                "attributes": dict(item.attrib),
-            }
-            data.append(data_elem)
-        # データの整形
-        df = pd.DataFrame(data)
+        df = read_xml_elements(source)
     elif "gpx" in filename:
         # GPXファイルの場合
-        gpx = gpxpy.parse(io.BytesIO(decoded))
-        latlon_data = []
-        data = []
-        for track in gpx.tracks:
-            for segment in track.segments:
-                segment_data = []
-                for point in segment.points:
-                    segment_data.append([point.latitude, point.longitude])
-                    data.append(
-                        {
-                            "Latitude": point.latitude,
-                            "Longitude": point.longitude,
-                            "Elevation": point.elevation,
-                        }
-                    )
-                latlon_data.append(segment_data)
-        df = pd.DataFrame(data)
-        return df, latlon_data, content_type  # latlon_dataを返す
+        # 点ごとのオブジェクトを作らずに緯度・経度・標高を配列へ読み込む
+        track = read_gpx(source, on_progress=on_progress)
+        df = track.frame()
+        return df, track, content_type
     else:
         raise Exception("Unsupported file type")
     return df, None, content_type
 
 
-def calculate_center(positions):
-    latitudes = []
-    longitudes = []
-    for pair in positions:
-        latitudes.append(pair[0])
-        longitudes.append(pair[1])
-    center_lat = sum(latitudes) / len(latitudes)
-    center_lon = sum(longitudes) / len(longitudes)
-    return [center_lat, center_lon]
-
-
-def calculate_zoom(positions, map_width, map_height):
-    latitudes = []
-    longitudes = []
-    for pair in positions:
-        latitudes.append(pair[0])
-        longitudes.append(pair[1])
-    min_lat, max_lat = min(latitudes), max(latitudes)
-    min_lon, max_lon = min(longitudes), max(longitudes)
-    lat_range = max_lat - min_lat
-    lon_range = max_lon - min_lon
-    map_width_in_tiles = map_width / 256
-    map_height_in_tiles = map_height / 256
-    zoom_x = math.log(map_width_in_tiles / lon_range) / math.log(2)
-    zoom_y = math.log(map_height_in_tiles / lat_range) / math.log(2)
-    zoom = min(zoom_x, zoom_y)
-    return zoom
+def export_health_records(df, filename):
+    # エクスポート
+    df.to_parquet(f"./export/{filename}.parquet", engine="pyarrow")
+    # csvファイルにエクスポート
+    df[["startDate", "endDate", "value", "unit", "device"]].to_csv(
+        f"./export/{filename}.csv", index=False
+    )
+
+
+def load_dataset(key, source, filename, content_type, set_progress=None):
+    # 同じ内容のファイルは再解析せず、キャッシュ済みの結果を使う
+    if key in dataset_cache:
+        return key
+    if isinstance(source, str):
+        source = open(source, "rb")
+    with source:
+        total = source.seek(0, io.SEEK_END)
+        source.seek(0)
+
+        def on_progress(rows):
+            set_progress((str(source.tell()), str(total), f"{rows:,} rows"))
+
+        df, track, content_type = parse_contents(
+            source, filename, content_type, on_progress if set_progress else None
+        )
+    # バックグラウンドのプロセスで作った結果をサーバー側から読めるよう、ディスクにも書き出す
+    if "text/xml" in content_type:
+        export_health_records(df, filename)
+        dataset_cache.put(f"{key}_rollups", build_rollups(df), persist=True)
+    dataset_cache.put(key, (df, track, content_type), persist=True)
+    return key
+
+
+def get_rollups(key, df):
+    # 集計済みキューブが追い出されていた場合だけ作り直す
+    rollups = dataset_cache.get(f"{key}_rollups")
+    if rollups is None:
+        rollups = dataset_cache.put(f"{key}_rollups", build_rollups(df))
+    return rollups
+
+
+def get_scatter_series(key, df):
+    # 散布図用に startDate で並べ替えた配列。ズームのたびに並べ替えないようキャッシュする
+    series = dataset_cache.get(f"{key}_scatter")
+    if series is None:
+        valid = df.dropna(subset=["startDate", "value"]).sort_values("startDate")
+        series = dataset_cache.put(
+            f"{key}_scatter",
+            (valid["startDate"].to_numpy(), valid["value"].to_numpy()),
+        )
+    return series
+
+
+def viewport_width(viewport_size_json):
+    if not viewport_size_json:
+        return None
+    return json.loads(viewport_size_json)["width"]
+
+
+def rollup_figures(key, df, selected_value):
+    # デバイスごとの縦積み棒グラフと期間合計は前計算済みのキューブから作成
+    rollup = get_rollups(key, df).get(selected_value)
+    if rollup is None:
+        # 日時と値の両方がそろった WalkingRunning の記録が1件もない
+        title = f"No walking/running data ({selected_value})"
+        return go.Figure(layout={"title": title}), go.Figure(layout={"title": title})
+    # Create a Plotly Express figure
+    fig_bar = px.bar(
+        rollup["by_device"],
+        x="duration",
+        y="value",
+        color="simple_device",
+        title=f"Values per Device ({selected_value})",
+        labels={"value": "(km)", "duration": "duration"},
+        height=600,
+    )
+    # Customize aspect of the layout
+    fig_bar.update_layout(barmode="stack")
+    # 選択された期間でリサンプリングした合計
+    resampled_data = rollup["total"]
+
+    # プロットの作成
+    fig_sum = px.line(
+        resampled_data,
+        x="startDate",
+        y="value",
+        title=f"Walking Distance Over Time ({selected_value})",
+        labels={"value": "(km)", "startDate": "startDate"},
+    )
+    return fig_sum, fig_bar
+
+
+def walking_scatter(x, y, width, x_range=None):
+    # 画面の幅に合わせて LTTB で間引き、点が多いときは WebGL で描画する
+    xs, ys, n_points = downsample(x, y, width, x_range)
+    fig = px.scatter(
+        pd.DataFrame({"startDate": xs, "value": ys}),
+        x="startDate",
+        y="value",
+        title=f"Walking Distance Over Time Scatter ({len(xs):,} / {n_points:,} points)",
+        labels={"value": "(km)", "startDate": "startDate"},
+        render_mode=render_mode(len(xs)),
+    )
+    if x_range is not None:
+        fig.update_xaxes(range=[str(v) for v in x_range])
+    return fig
+
+
+@app.callback(
+    Output("dataset-key", "data"),
+    [Input("upload-data", "contents"), Input("chunked-upload", "data")],
+    State("upload-data", "filename"),
+    background=True,
+    progress=[
+        Output("parse-progress", "value"),
+        Output("parse-progress", "max"),
+        Output("parse-progress-label", "children"),
+    ],
+    progress_default=["0", "1", ""],
+    running=[
+        (Output("cancel-upload", "disabled"), False, True),
+        (
+            Output("parse-progress-area", "style"),
+            {"textAlign": "center"},
+            {"display": "none"},
+        ),
+    ],
+    cancel=[Input("cancel-upload", "n_clicks")],
+    prevent_initial_call=True,
+)
+def store_upload(set_progress, contents, chunked, filename):
+    if ctx.triggered_id == "chunked-upload" and chunked:
+        # 分割アップロードはディスク上のファイルから直接解析する
+        key = chunked["key"]
+        filename = chunked["filename"]
+        content_type = chunked["content_type"] or mimetypes.guess_type(filename)[0]
+        load_dataset(key, spool_path(key), filename, content_type or "", set_progress)
+        return {"key": key, "filename": filename}
+    if contents is None:
+        return None
+    content_type, content_string = contents.split(",")
+    decoded = base64.b64decode(content_string)
+    key = content_hash(decoded)
+    load_dataset(key, io.BytesIO(decoded), filename, content_type, set_progress)
+    return {"key": key, "filename": filename}
 
 
 @app.callback(
@@ -161,35 +314,40 @@ def calculate_zoom(positions, map_width, map_height):
         Output("output-data-upload", "children"),
         Output("map", "children"),
     ],
-    [Input("upload-data", "contents"), Input("time_dropdown", "value")],
-    [
-        State("upload-data", "filename"),
-        State("viewport-size", "children"),
-    ],
+    Input("dataset-key", "data"),
+    [State("time_dropdown", "value"), State("viewport-size", "children")],
 )
-def update_output(contents, selected_value, filename, viewport_size_json):
-    if contents is None:
+def update_output(dataset, selected_value, viewport_size_json):
+    if dataset is None:
         return title_div, html.Div(["No data uploaded yet"]), []
+    parsed = dataset_cache.get(dataset["key"])
+    if parsed is None:
+        return title_div, html.Div(["Data expired, please upload the file again"]), []
+    filename = dataset["filename"]
     file_info_div = html.Div(f"File: {filename}")
-    df, latlon_data, content_type = parse_contents(contents, filename)
+    df, track, content_type = parsed
     print(f"content_type: {content_type}")
-    if latlon_data:
-        positions = latlon_data[0]
-        center = calculate_center(positions)
+    if track:
+        center = track.center()
         if viewport_size_json:
             viewport_size = json.loads(viewport_size_json)
             map_width = viewport_size["width"]
             map_height = viewport_size["height"] * 0.5  # Convert 50vh to pixels
-            zoom = calculate_zoom(positions, map_width, map_height)
+            zoom = track.fit_zoom(map_width, map_height)
         else:
             zoom = 10  # Default zoom level
         return (
             title_div,
             html.Div([file_info_div]),
             dl.Map(
+                id="track-map",
                 children=[
                     dl.TileLayer(),
-                    dl.Polyline(positions=positions, color="blue"),
+                    # ズームに合わせて間引いた折れ線。拡大・縮小のたびに update_track_detail で差し替える
+                    dl.LayerGroup(
+                        id="track-layer",
+                        children=track_polylines(level_of_detail(track.segments, zoom)),
+                    ),
                     # dl.Marker(position=center, children=dl.Tooltip("Center")),
                 ],
                 center=center,
@@ -201,7 +359,10 @@ def update_output(contents, selected_value, filename, viewport_size_json):
         # Row Number列が9以降のデータをフィルタリング
         filtered_df = df[df["Row Number"] >= 9]
         # 名前列をfloat型に変換
-        filtered_df["名前"] = filtered_df["名前"].astype(float)
+        # (カテゴリ型になっている場合は見出し行の文字列もカテゴリに残っているため、
+        # カテゴリのまま変換せず、絞り込んだ後の値だけを数値にする)
+        values = filtered_df["名前"].astype(object)
+        filtered_df["名前"] = pd.to_numeric(values).astype(float)
         # 散布図の作成
         fig = px.line(
             filtered_df,
@@ -215,104 +376,57 @@ def update_output(contents, selected_value, filename, viewport_size_json):
             [],
         )
     elif "text/xml" in content_type:
-        # attributes列の辞書をJSON文字列に変換
-        df["attributes"] = df["attributes"].apply(json.dumps)
-        # "HKQuantityTypeIdentifierDistanceWalkingRunning"と'unit="km"'を含む行をフィルタリングします。
-        df = df[
-            (
-                df.loc[:, "attributes"].str.contains(
-                    "HKQuantityTypeIdentifierDistanceWalkingRunning"
-                )
-            )
-        ]
-        # df["attributes"]の要素をjson.loads関数を使用して辞書に変換します。
-        df["attributes"] = df["attributes"].apply(json.loads)
-        # json_normalize関数を使用して辞書を展開します。
-        attribute_list = df["attributes"].values.tolist()
-        df = pd.json_normalize(attribute_list)
-        # エクスポート
-        df.to_parquet(f"./export/{filename}.parquet", engine="pyarrow")
+        # parse_contents で WalkingRunning の Record のみに絞り込み済み
         # 必要な列のみを抽出
         df = df[["startDate", "endDate", "value", "unit", "device"]]
-        # csvファイルにエクスポート
-        df.to_csv(f"./export/{filename}.csv", index=False)
-        # 欠損値の処理
-        df = df.dropna(subset=["value"])
-        # 'startDate'カラムをdatetime型に変換
-        df["startDate"] = pd.to_datetime(df["startDate"], format="%Y-%m-%d %H:%M:%S %z")
-        # 日時を指定された形式に変換します。
-        df["startDate"] = df["startDate"].dt.strftime("%Y-%m-%d %H:%M:%S")
-        # 'value'カラムをfloat型に変換
-        df["value"] = df["value"].astype(float)
+        # 欠損値の処理 (startDate / value は parse_contents で型変換済み)
+        df = df.dropna(subset=["startDate", "value"])
         # 散布図の作成
-        fig_scatter = px.scatter(
-            df,
-            x="startDate",
-            y="value",
-            title="Walking Distance Over Time Scatter",
-            labels={"value": "(km)", "startDate": "startDate"},
-        )
-        # デバイスごとにグループ化して縦積み棒グラフを作成
-        df["startDate"] = pd.to_datetime(df["startDate"], errors="coerce")
-        df["duration"] = df["startDate"].dt.to_period(selected_value)
-        df["simple_device"] = df["device"].apply(extract_device_name)
-        grouped_df = (
-            df.groupby(["duration", "simple_device"])["value"].sum().reset_index()
-        )
-        # 日時を指定された形式に変換します。
-        grouped_df["duration"] = grouped_df["duration"].astype(str)
-        # Create a Plotly Express figure
-        fig_bar = px.bar(
-            grouped_df,
-            x="duration",
-            y="value",
-            color="simple_device",
-            title=f"Values per Device ({selected_value})",
-            labels={"value": "(km)", "duration": "duration"},
-            height=600,
-        )
-        # Customize aspect of the layout
-        fig_bar.update_layout(barmode="stack")
-        # 選択された期間でデータをリサンプリング
-        df_sum = df[["startDate", "value"]].copy()
-        df_sum["startDate"] = pd.to_datetime(
-            df_sum["startDate"]
-        )  # startDate列を再度日時形式に変換
-        df_sum.set_index("startDate", inplace=True)  # startDate列をインデックスに設定
-        resampled_data = df_sum.resample(selected_value).sum()
-        resampled_data.reset_index(inplace=True)  # インデックスをリセットして新しい'startDate'列を作成
-
-        # プロットの作成
-        fig_sum = px.line(
-            resampled_data,
-            x="startDate",
-            y="value",
-            title=f"Walking Distance Over Time ({selected_value})",
-            labels={"value": "(km)", "startDate": "startDate"},
-        )
+        x, y = get_scatter_series(dataset["key"], df)
+        fig_scatter = walking_scatter(x, y, viewport_width(viewport_size_json))
+        # 集計キューブの作り直しには simple_device 列が要るので、絞り込む前の表を渡す
+        fig_sum, fig_bar = rollup_figures(dataset["key"], parsed[0], selected_value)
 
+        # 各グラフの横に、表示中の図のバージョンを持たせる (差分更新用)
         return (
             title_div,
             html.Div(
                 [
                     file_info_div,
-                    dcc.Graph(figure=fig_sum),
-                    dcc.Graph(figure=fig_scatter),
-                    dcc.Graph(figure=fig_bar),
+                    dcc.Graph(id="sum-graph", figure=fig_sum),
+                    dcc.Store(id="sum-version", data=figure_differ.remember(fig_sum)),
+                    dcc.Graph(id="scatter-graph", figure=fig_scatter),
+                    dcc.Store(
+                        id="scatter-version",
+                        data=figure_differ.remember(fig_scatter),
+                    ),
+                    dcc.Graph(id="bar-graph", figure=fig_bar),
+                    dcc.Store(id="bar-version", data=figure_differ.remember(fig_bar)),
                 ]
             ),
             [],
         )
     else:
+        data, page_count = query_frame(df, 0, TABLE_PAGE_SIZE)
         return (
             title_div,
             html.Div(
                 [
                     file_info_div,
+                    # ページ送り・並べ替え・絞り込みはサーバー側で行い、表示中のページだけを送る
                     dash_table.DataTable(
-                        data=df.to_dict("records"),
-                        columns=[{"name": i, "id": i} for i in df.columns],
-                        page_size=1000,
+                        id="upload-table",
+                        data=data,
+                        columns=table_columns(df),
+                        page_current=0,
+                        page_size=TABLE_PAGE_SIZE,
+                        page_count=page_count,
+                        page_action="custom",
+                        sort_action="custom",
+                        sort_mode="multi",
+                        sort_by=[],
+                        filter_action="custom",
+                        filter_query="",
                     ),
                 ]
             ),
@@ -320,6 +434,106 @@ def update_output(contents, selected_value, filename, viewport_size_json):
         )
 
 
+@app.callback(
+    [Output("upload-table", "data"), Output("upload-table", "page_count")],
+    [
+        Input("upload-table", "page_current"),
+        Input("upload-table", "page_size"),
+        Input("upload-table", "sort_by"),
+        Input("upload-table", "filter_query"),
+    ],
+    State("dataset-key", "data"),
+    prevent_initial_call=True,
+)
+def update_table(page_current, page_size, sort_by, filter_query, dataset):
+    parsed = dataset_cache.get(dataset["key"]) if dataset else None
+    if parsed is None:
+        return [], 1
+    return query_frame(parsed[0], page_current, page_size, sort_by, filter_query)
+
+
+@app.callback(
+    [
+        Output("sum-graph", "figure"),
+        Output("sum-version", "data"),
+        Output("bar-graph", "figure"),
+        Output("bar-version", "data"),
+    ],
+    Input("time_dropdown", "value"),
+    [
+        State("dataset-key", "data"),
+        State("sum-version", "data"),
+        State("bar-version", "data"),
+    ],
+    prevent_initial_call=True,
+)
+def update_rollup_graphs(selected_value, dataset, sum_version, bar_version):
+    # 期間の切り替えでは2つのグラフだけを作り直し、変わった部分 (x・y・タイトル) を送る
+    parsed = dataset_cache.get(dataset["key"]) if dataset else None
+    if parsed is None:
+        return [dash.no_update] * 4
+    fig_sum, fig_bar = rollup_figures(dataset["key"], parsed[0], selected_value)
+    return (
+        *figure_differ.update(fig_sum, sum_version),
+        *figure_differ.update(fig_bar, bar_version),
+    )
+
+
+@app.callback(
+    [Output("scatter-graph", "figure"), Output("scatter-version", "data")],
+    Input("scatter-graph", "relayoutData"),
+    [
+        State("dataset-key", "data"),
+        State("viewport-size", "children"),
+        State("scatter-version", "data"),
+    ],
+    prevent_initial_call=True,
+)
+def update_scatter_detail(relayout_data, dataset, viewport_size_json, version):
+    # ズームした範囲だけを元データから取り直して、細かい点を表示する
+    if not relayout_data or dataset is None:
+        return dash.no_update, dash.no_update
+    if "xaxis.range[0]" in relayout_data:
+        x_range = (relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"])
+    elif "xaxis.range" in relayout_data:
+        x_range = tuple(relayout_data["xaxis.range"])
+    elif relayout_data.get("xaxis.autorange"):
+        x_range = None
+    else:
+        return dash.no_update, dash.no_update
+    parsed = dataset_cache.get(dataset["key"])
+    if parsed is None:
+        return dash.no_update, dash.no_update
+    x, y = get_scatter_series(dataset["key"], parsed[0])
+    if x_range is not None:
+        x_range = tuple(pd.Timestamp(v).to_datetime64() for v in x_range)
+    fig = walking_scatter(x, y, viewport_width(viewport_size_json), x_range)
+    # 点の配列・タイトル・表示範囲だけを Patch で送る
+    return figure_differ.update(fig, version)
+
+
+def track_polylines(positions_list):
+    return [
+        dl.Polyline(positions=positions, color="blue") for positions in positions_list
+    ]
+
+
+@app.callback(
+    Output("track-layer", "children"),
+    [Input("track-map", "zoom"), Input("track-map", "bounds")],
+    State("dataset-key", "data"),
+    prevent_initial_call=True,
+)
+def update_track_detail(zoom, bounds, dataset):
+    if zoom is None or dataset is None:
+        return dash.no_update
+    parsed = dataset_cache.get(dataset["key"])
+    if parsed is None or not parsed[1]:
+        return dash.no_update
+    track = parsed[1]
+    return track_polylines(level_of_detail(track.segments, zoom, bounds))
+
+
 app.clientside_callback(
     """
     function updateViewportSize(n_intervals) {
@@ -332,5 +546,25 @@ app.clientside_callback(
     Input("interval-component", "n_intervals"),
 )
 
+app.clientside_callback(
+    """
+    function readChunkedUpload(n_intervals, current) {
+        var state = window.chunkedUploadState;
+        var no_update = window.dash_clientside.no_update;
+        if (!state) {
+            return [no_update, no_update];
+        }
+        var result = state.result;
+        if (!result || (current && current.key === result.key)) {
+            result = no_update;
+        }
+        return [result, state.message];
+    }
+    """,
+    [Output("chunked-upload", "data"), Output("chunked-upload-status", "children")],
+    Input("interval-component", "n_intervals"),
+    State("chunked-upload", "data"),
+)
+
 if __name__ == "__main__":
     app.run_server(debug=True)
@@ -1,12 +1,30 @@
 import os
-import io
 import base64
+import functools
+import hashlib
+import json
+import math
+import tempfile
 import dash
-from dash import html, dcc, dash_table, Input, Output, State
-import pandas as pd
+from dash import html, dcc, dash_table, ctx, Input, Output, State
+import pyarrow.parquet as pq
+
+from catalog import DatasetCatalog
+from ingest import read_csv
+from parquet_store import write_dataset
 
 app = dash.Dash(__name__)
 
+catalog = DatasetCatalog()
+
+PREVIEW_ROWS = 5
+FILES_PER_PAGE = 20
+# Uploaded bytes and their Parquet conversion, stored once per content hash.
+# parquet_files/ and csv_files/ hold hard links to these blobs under each name.
+BLOB_DIR = "./blobs"
+# Base64 characters decoded at a time (a multiple of 4)
+DECODE_BLOCK = 4 * 2**20
+
 app.layout = html.Div(
     [
         dcc.Upload(
@@ -14,6 +32,14 @@ app.layout = html.Div(
         ),
         html.Div(id="output-data-upload"),
         dcc.Input(id="filter-input", type="text", placeholder="Filter files..."),
+        html.Div(
+            [
+                html.Button("Previous", id="prev-page"),
+                html.Span(id="page-info", style={"margin": "0 10px"}),
+                html.Button("Next", id="next-page"),
+            ]
+        ),
+        dcc.Store(id="file-page", data=0),
         html.Div(id="file-list"),
     ]
 )
@@ -29,16 +55,28 @@ def upload_file(contents, filename):
         return "Please upload a file."
 
     content_type, content_string = contents.split(",")
-    decoded = base64.b64decode(content_string)
 
     try:
         if "csv" in filename:
-            df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-            df.to_parquet(
-                f"./parquet_files/{filename.replace('.csv', '.parquet')}",
-                engine="pyarrow",
-            )
-            df.to_csv(f"./csv_files/{filename}", index=False)
+            parquet_name = filename.replace(".csv", ".parquet")
+            parquet_path = f"./parquet_files/{parquet_name}"
+            digest = store_blob(content_string, ".csv")
+            csv_blob = blob_path(digest, ".csv")
+            parquet_blob = blob_path(digest, ".parquet")
+            dataset = catalog.find_by_hash(digest)
+            if dataset is not None and os.path.exists(parquet_blob):
+                # Same bytes as an earlier upload: only add another name for them
+                link_blob(parquet_blob, parquet_path)
+                link_blob(csv_blob, f"./csv_files/{filename}")
+                catalog.add_alias(parquet_name, parquet_path, dataset)
+                prune_blobs()
+                return f"Same content as {dataset['name']}; added {parquet_name}."
+            df = read_csv(csv_blob, categories=True)
+            write_dataset(df, parquet_blob)
+            link_blob(parquet_blob, parquet_path)
+            link_blob(csv_blob, f"./csv_files/{filename}")
+            catalog.add(parquet_name, parquet_path, df, content_hash=digest)
+            prune_blobs()
             return "File uploaded and saved as a Parquet file!"
         else:
             return "Unsupported file type. Please upload a CSV file."
@@ -46,37 +84,132 @@ def upload_file(contents, filename):
         return f"Error processing file: {str(e)}"
 
 
-@app.callback(
-    Output("file-list", "children"),
-    [Input("output-data-upload", "children"), Input("filter-input", "value")],
-)
-def update_file_list(upload_message, filter_value):
-    parquet_files_path = "./parquet_files"
-
+def blob_path(digest, suffix):
+    return os.path.join(BLOB_DIR, f"{digest}{suffix}")
+
+
+def store_blob(content_string, suffix):
+    # Decodes the base64 payload block by block into a temporary file and hashes
+    # it on the way, then keeps the file under its hash unless that blob exists.
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    sha256 = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=BLOB_DIR, suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        for start in range(0, len(content_string), DECODE_BLOCK):
+            block = base64.b64decode(content_string[start : start + DECODE_BLOCK])
+            sha256.update(block)
+            f.write(block)
+    digest = sha256.hexdigest()
+    path = blob_path(digest, suffix)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    return digest
+
+
+def link_blob(blob, path):
+    # A name is a hard link to the blob, so aliases take no extra disk
+    if os.path.exists(path):
+        os.remove(path)
+    os.link(blob, path)
+
+
+def prune_blobs():
+    # A blob whose only link is the one in BLOB_DIR is no longer named anywhere
+    for name in os.listdir(BLOB_DIR):
+        path = os.path.join(BLOB_DIR, name)
+        if not name.endswith(".part") and os.stat(path).st_nlink == 1:
+            os.remove(path)
+
+
+@functools.lru_cache(maxsize=1024)
+def load_preview(path, mtime):
+    # Only the Parquet footer and the first rows of the first row group are read.
+    # mtime is part of the cache key so a rewritten file gets a fresh preview.
+    parquet_file = pq.ParquetFile(path)
+    batch = next(parquet_file.iter_batches(batch_size=PREVIEW_ROWS), None)
+    if batch is None:
+        head = parquet_file.schema_arrow.empty_table().to_pandas()
+    else:
+        head = batch.to_pandas()
+    return parquet_file.metadata.num_rows, head
+
+
+def file_preview(path):
+    return load_preview(path, os.path.getmtime(path))
+
+
+def sync_catalog(parquet_files_path):
+    # Register Parquet files that were stored before the catalog existed, using
+    # only their footer and first rows.
     if not os.path.exists(parquet_files_path):
-        return "No files uploaded yet."
+        return
+    known = catalog.names()
+    for fname in os.listdir(parquet_files_path):
+        if fname.endswith(".parquet") and fname not in known:
+            path = f"{parquet_files_path}/{fname}"
+            num_rows, head = file_preview(path)
+            catalog.add(fname, path, head, num_rows=num_rows)
 
-    parquet_files = [
-        f for f in os.listdir(parquet_files_path) if f.endswith(".parquet")
-    ]
 
-    # Apply filtering if filter_value is not None and not empty
-    if filter_value:
-        parquet_files = [f for f in parquet_files if filter_value.lower() in f.lower()]
+sync_catalog("./parquet_files")
+
+
+@app.callback(
+    [
+        Output("file-list", "children"),
+        Output("file-page", "data"),
+        Output("page-info", "children"),
+    ],
+    [
+        Input("output-data-upload", "children"),
+        Input("filter-input", "value"),
+        Input("prev-page", "n_clicks"),
+        Input("next-page", "n_clicks"),
+    ],
+    State("file-page", "data"),
+)
+def update_file_list(upload_message, filter_value, prev_clicks, next_clicks, page):
+    # Listing and filtering are answered from the catalog, not the data files
+    if ctx.triggered_id == "prev-page":
+        page = max(page - 1, 0)
+    elif ctx.triggered_id == "next-page":
+        page = page + 1
+    else:
+        page = 0
+    datasets, total = catalog.search(
+        filter_value, limit=FILES_PER_PAGE, offset=page * FILES_PER_PAGE
+    )
+    page_count = max(1, math.ceil(total / FILES_PER_PAGE))
+    if page >= page_count:
+        page = page_count - 1
+        datasets, total = catalog.search(
+            filter_value, limit=FILES_PER_PAGE, offset=page * FILES_PER_PAGE
+        )
+
+    if total == 0 and not filter_value:
+        return "No files uploaded yet.", 0, ""
 
     file_list_components = []
 
-    for fname in parquet_files:
-        df = pd.read_parquet(f"{parquet_files_path}/{fname}")
+    for dataset in datasets:
+        columns = [column["name"] for column in json.loads(dataset["schema"])]
 
         table_preview = dash_table.DataTable(
-            data=df.head(5).to_dict("records"),
-            columns=[{"name": i, "id": i} for i in df.columns],
+            data=json.loads(dataset["preview"]),
+            columns=[{"name": i, "id": i} for i in columns],
         )
 
         file_list_components.append(
             html.Div(
-                [html.H5(fname), table_preview],
+                [
+                    html.H5(
+                        f"{dataset['name']} ({dataset['num_rows']:,} rows, "
+                        f"{dataset['num_bytes']:,} bytes)"
+                    ),
+                    table_preview,
+                ],
                 style={
                     "border": "1px solid black",
                     "margin-bottom": "10px",
@@ -85,7 +218,8 @@ def update_file_list(upload_message, filter_value):
             )
         )
 
-    return file_list_components
+    page_info = f"Page {page + 1} / {page_count} ({total} files)"
+    return file_list_components, page, page_info
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+import math
+
+import pandas as pd
+
+
+# DataTable の filter_query で使われる演算子と、対応する pandas の比較
+OPERATORS = [
+    ["ge ", ">="],
+    ["le ", "<="],
+    ["lt ", "<"],
+    ["gt ", ">"],
+    ["ne ", "!="],
+    ["eq ", "="],
+    ["contains "],
+    ["datestartswith "],
+]
+
+
+def split_filter_part(filter_part):
+    # "{列名} 演算子 値" を (列名, 演算子, 値) に分解する
+    for operator_type in OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ""
+                if v0 == value_part[-1:] and v0 in ("'", '"', "`"):
+                    value = value_part[1:-1].replace("\\" + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # 単語の演算子は表記に関わらず最初の表記に揃える
+                return name, operator_type[0].strip(), value
+
+    return [None] * 3
+
+
+def _plain(column):
+    # 順序なしのカテゴリ列は比較・並べ替えができないので、元の値の列に戻す
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.astype(column.cat.categories.dtype)
+    return column
+
+
+def _compare(column, operator, value):
+    column = _plain(column)
+    try:
+        return getattr(column, operator)(value)
+    except TypeError:
+        # 文字列の列に "> 5" のような型の合わない比較をしたときは文字列どうしで比べる
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return getattr(column.astype(str), operator)(str(value))
+
+
+def filter_frame(df, filter_query):
+    # DataTable の列 id は文字列なので、元の列名に戻して参照する
+    columns = {str(c): c for c in df.columns}
+    for filter_part in (filter_query or "").split(" && "):
+        col_name, operator, filter_value = split_filter_part(filter_part)
+        if col_name not in columns:
+            continue
+        column = df[columns[col_name]]
+        if operator in ("eq", "ne", "lt", "le", "gt", "ge"):
+            df = df.loc[_compare(column, operator, filter_value)]
+        elif operator == "contains":
+            df = df.loc[column.astype(str).str.contains(str(filter_value), regex=False)]
+        elif operator == "datestartswith":
+            df = df.loc[column.astype(str).str.startswith(str(filter_value))]
+    return df
+
+
+def query_frame(df, page_current, page_size, sort_by=None, filter_query=None):
+    # サーバー側のフレームに filter → sort → ページ切り出しを適用し、
+    # 表示するページのレコードと総ページ数を返す
+    df = filter_frame(df, filter_query)
+    if sort_by:
+        columns = {str(c): c for c in df.columns}
+        df = df.sort_values(
+            [columns[col["column_id"]] for col in sort_by],
+            ascending=[col["direction"] == "asc" for col in sort_by],
+            inplace=False,
+            key=_plain,
+        )
+    page_count = max(1, math.ceil(len(df) / page_size))
+    start = page_current * page_size
+    page = df.iloc[start : start + page_size]
+    return page.rename(columns=str).to_dict("records"), page_count
+
+
+def table_columns(df):
+    return [{"name": str(i), "id": str(i)} for i in df.columns]
@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+ROW_GROUP_SIZE = 128 * 1024
+COMPRESSION = "zstd"
+COMPRESSION_LEVEL = 3
+# Columns whose distinct/total ratio is at or below this are dictionary encoded
+DICTIONARY_RATIO = 0.5
+
+
+def low_cardinality_columns(df, ratio=DICTIONARY_RATIO):
+    if len(df) == 0:
+        return []
+    return [
+        str(column)
+        for column in df.columns
+        if df[column].nunique(dropna=True) <= ratio * len(df)
+    ]
+
+
+def write_dataset(
+    df,
+    path,
+    row_group_size=ROW_GROUP_SIZE,
+    compression=COMPRESSION,
+    compression_level=COMPRESSION_LEVEL,
+    sort_by=None,
+    partition_cols=None,
+):
+    # Writes df with bounded row groups, zstd compression, dictionary encoding for
+    # low-cardinality columns and min/max statistics on every column chunk, so
+    # pq.read_table(..., filters=...) can skip row groups that cannot match.
+    # Sorting by the usual filter column makes those statistics much tighter.
+    if sort_by:
+        df = df.sort_values(sort_by, kind="stable", ignore_index=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    options = dict(
+        row_group_size=row_group_size,
+        compression=compression,
+        compression_level=compression_level,
+        use_dictionary=low_cardinality_columns(df),
+        write_statistics=True,
+    )
+    if partition_cols:
+        # One directory per partition value (hive style), e.g. path/Brand=Toyota/
+        pq.write_to_dataset(table, path, partition_cols=partition_cols, **options)
+    else:
+        pq.write_table(table, path, **options)
+    return path
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def _dataset_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def compare_layouts(df, filter_column=None, **writer_options):
+    # Size and scan-time report of the default df.to_parquet output against
+    # write_dataset. The filtered scan reads rows above the median of
+    # filter_column, which is where row-group statistics pay off.
+    filters = None
+    if filter_column is not None:
+        filters = [(filter_column, ">", df[filter_column].median())]
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        layouts = {
+            "default": lambda path: df.to_parquet(path, engine="pyarrow"),
+            "optimized": lambda path: write_dataset(df, path, **writer_options),
+        }
+        for layout, write in layouts.items():
+            path = os.path.join(tmp, f"{layout}.parquet")
+            write_seconds = _timed(lambda: write(path))
+            row = {
+                "layout": layout,
+                "bytes": _dataset_bytes(path),
+                "write_s": write_seconds,
+                "full_scan_s": _timed(lambda: pq.read_table(path)),
+            }
+            if filters is not None:
+                row["filtered_scan_s"] = _timed(
+                    lambda: pq.read_table(path, filters=filters)
+                )
+            report.append(row)
+    return pd.DataFrame(report)
+
+
+if __name__ == "__main__":
+    # python parquet_store.py data.csv [filter_column]
+    frame = pd.read_csv(sys.argv[1])
+    column = sys.argv[2] if len(sys.argv) > 2 else None
+    sort_by = [column] if column else None
+    print(compare_layouts(frame, filter_column=column, sort_by=sort_by).to_string())
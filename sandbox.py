@@ -0,0 +1,204 @@
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module, so no memory cap there
+    resource = None
+
+
+WORK_DIR = "./cache/sandbox"
+WORKERS = min(4, os.cpu_count() or 1)
+TIMEOUT_SECONDS = 60
+# Address space limit of each worker process
+MEMORY_BYTES = 4 * 2**30
+
+
+class SandboxError(Exception):
+    pass
+
+
+class SandboxTimeout(SandboxError):
+    pass
+
+
+class SandboxCancelled(SandboxError):
+    pass
+
+
+def write_ipc(df, path):
+    table = pa.Table.from_pandas(df)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_ipc(path):
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def _serve(conn, memory_bytes):
+    # Worker process: the libraries snippets use are imported once up front, so
+    # a run only pays for the snippet itself
+    import numpy as np
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from scipy.stats import linregress
+
+    namespace = {"np": np, "pd": pd, "px": px, "go": go, "linregress": linregress}
+    if resource is not None and memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    while True:
+        try:
+            code, input_path, output, output_path = conn.recv()
+        except EOFError:
+            return
+        try:
+            df = read_ipc(input_path) if input_path else None
+            local_vars = {"df": df, "fig": None}
+            exec(code, dict(namespace), local_vars)
+            if output == "df":
+                write_ipc(local_vars["df"], output_path)
+                result = output_path
+            else:
+                fig = local_vars["fig"]
+                result = fig.to_dict() if hasattr(fig, "to_dict") else fig
+            conn.send(("ok", result))
+        except MemoryError:
+            # The process may be in a bad state afterwards; the parent replaces it
+            conn.send(("memory", traceback.format_exc()))
+        except BaseException:
+            conn.send(("error", traceback.format_exc()))
+
+
+class _Worker:
+    def __init__(self, context, memory_bytes):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_serve, args=(child_conn, memory_bytes), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.cancelled = False
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class Sandbox:
+    # Runs user code in a pool of pre-started worker processes instead of the
+    # Dash worker. A run that exceeds the timeout, hits the memory cap or is
+    # cancelled only costs its worker, which is killed and replaced.
+    # The input frame reaches the worker as an Arrow IPC file that it memory-maps,
+    # and a frame result comes back the same way.
+
+    def __init__(
+        self,
+        workers=WORKERS,
+        timeout=TIMEOUT_SECONDS,
+        memory_bytes=MEMORY_BYTES,
+        work_dir=WORK_DIR,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_bytes = memory_bytes
+        self.work_dir = work_dir
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = None
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # Started on first use, so importing the app does not spawn processes
+        with self._lock:
+            if self._idle is None:
+                os.makedirs(self.work_dir, exist_ok=True)
+                self._idle = queue.Queue()
+                for _ in range(self.workers):
+                    self._idle.put(self._spawn())
+
+    def _spawn(self):
+        return _Worker(self._context, self.memory_bytes)
+
+    def _tmp_path(self):
+        return os.path.join(self.work_dir, f"{uuid.uuid4().hex}.arrow")
+
+    def run(self, code, data=None, output="df", timeout=None, token=None):
+        # data is a DataFrame or the path of an Arrow IPC file holding one.
+        # output="df" returns the snippet's df, output="fig" its fig as a dict.
+        # token (e.g. a session id) lets cancel() stop this run.
+        self._start()
+        timeout = self.timeout if timeout is None else timeout
+        tmp_paths = []
+        input_path = data
+        if isinstance(data, pd.DataFrame):
+            input_path = self._tmp_path()
+            write_ipc(data, input_path)
+            tmp_paths.append(input_path)
+        output_path = None
+        if output == "df":
+            output_path = self._tmp_path()
+            tmp_paths.append(output_path)
+        worker = self._idle.get()
+        with self._lock:
+            self._running.setdefault(token, []).append(worker)
+        try:
+            try:
+                worker.conn.send((code, input_path, output, output_path))
+                if not worker.conn.poll(timeout):
+                    worker.kill()
+                    raise SandboxTimeout(
+                        f"Code did not finish within {timeout} seconds"
+                    )
+                status, result = worker.conn.recv()
+            except (EOFError, OSError):
+                # Killed by cancel() or died; kill() reaps it so it is replaced below
+                worker.kill()
+                if worker.cancelled:
+                    raise SandboxCancelled("Cancelled")
+                raise SandboxError("The worker process running the code died")
+            if status == "memory":
+                worker.kill()
+            if status != "ok":
+                raise SandboxError(result)
+            if output == "df":
+                return read_ipc(result)
+            return result
+        finally:
+            # Once removed from _running, cancel() can no longer reach the worker,
+            # so the cancelled flag read after this is final
+            with self._lock:
+                self._running[token].remove(worker)
+                if not self._running[token]:
+                    del self._running[token]
+            if worker.cancelled or worker.conn.closed or not worker.process.is_alive():
+                # A killed worker may not have been reaped yet, so is_alive() alone
+                # could put a dead process back into the pool
+                worker.kill()
+                worker = self._spawn()
+            self._idle.put(worker)
+            for path in tmp_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def cancel(self, token):
+        # Killed while holding the lock, so a worker that run() has already
+        # returned to the pool is never hit
+        with self._lock:
+            workers = list(self._running.get(token, []))
+            for worker in workers:
+                worker.cancelled = True
+                worker.process.kill()
+        return len(workers)
@@ -0,0 +1,113 @@
+import os
+import re
+import shutil
+import time
+
+import pyarrow as pa
+
+
+STORE_DIR = "./cache/sessions"
+# Keys not read or written for this long are removed
+TTL_SECONDS = 60 * 60
+# Least recently used keys are removed first while the store is larger than this
+MAX_BYTES = 4 * 2**30
+
+VERSION_KEY = b"dataset_version"
+
+_NAME = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+def _dir_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+class SessionStore:
+    # Named DataFrames grouped under a key, kept on disk as Arrow IPC files
+    # instead of in a module-level variable. Any worker process can memory-map
+    # them, so the app no longer depends on every request reaching the same
+    # process. The key is a browser session id (FrontendVIzExecTwice) or the
+    # content hash of an upload (FrontendVizExec); a whole key is evicted at once.
+
+    def __init__(self, root=STORE_DIR, ttl=TTL_SECONDS, max_bytes=MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, key):
+        # key comes from the browser, so it must not be able to name a path
+        if not key or not _NAME.match(key):
+            raise ValueError(f"Invalid store key: {key!r}")
+        return os.path.join(self.root, key)
+
+    def path(self, key, name):
+        return os.path.join(self._dir(key), f"{name}.arrow")
+
+    def put(self, key, name, df, version=None):
+        # version identifies the content (e.g. a hash of the upload), so callers
+        # can key caches on it without reading or hashing the frame
+        table = pa.Table.from_pandas(df)
+        if version is not None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[VERSION_KEY] = version.encode()
+            table = table.replace_schema_metadata(metadata)
+        dir_path = self._dir(key)
+        os.makedirs(dir_path, exist_ok=True)
+        path = self.path(key, name)
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        os.utime(dir_path)
+        self.evict()
+        return df
+
+    def get(self, key, name):
+        path = self.path(key, name)
+        try:
+            source = pa.memory_map(path)
+        except FileNotFoundError:
+            return None
+        with source:
+            # Arrow reads the mapped pages directly; to_pandas makes the one copy
+            # that the caller's code is free to modify
+            df = pa.ipc.open_file(source).read_all().to_pandas()
+        os.utime(self._dir(key))
+        return df
+
+    def version(self, key, name):
+        # Only the schema from the file footer is read, not the data
+        try:
+            with pa.memory_map(self.path(key, name)) as source:
+                metadata = pa.ipc.open_file(source).schema.metadata or {}
+        except FileNotFoundError:
+            return None
+        version = metadata.get(VERSION_KEY)
+        return None if version is None else version.decode()
+
+    def evict(self):
+        now = time.time()
+        sessions = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                mtime = os.path.getmtime(path)
+                if now - mtime > self.ttl:
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    sessions.append((mtime, _dir_bytes(path), path))
+            except FileNotFoundError:
+                # Removed by another worker in the meantime
+                continue
+        total = sum(size for _, size, _ in sessions)
+        # The most recently used key is always kept
+        for _, size, path in sorted(sessions)[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size